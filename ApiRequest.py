@@ -1,42 +1,314 @@
+import argparse
+import queue
+import signal
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from Metrics import metrics
 from Notion import Notion
+from Planner import Planner
+from RunJournal import RunJournal
 from Todoist import Todoist
-from util import getJsonFile
+from util import dumpToFile, getJsonFile
+from Watcher import Watcher
+from WebhookReceiver import WebhookReceiver
 
 
 class Main:
-    def __init__(self):
-        self.config = getJsonFile('config')
+    def __init__(self, config=None, no_cache=False):
+        self.config = config
+        if self.config is None:
+            self.config = getJsonFile('config')
+
+        if no_cache:
+            self.config['notion']['cache'] = False
+
         self.todo = Todoist(self.config['todoist'])
         self.notion = Notion(self.config['notion'])
 
-    def sync(self):
-        for project in self.notion.get_projects():
-            self.todo.set_main_project(project)
+    def sync(self, databases: list = None, epic_ids: dict = None):
+        metrics.reset()
+
+        # Only full runs are journaled; partial ones are cheap to repeat.
+        journal = None
+        if (
+                databases is None and
+                epic_ids is None and
+                'pipeline' in self.config and
+                'journalFile' in self.config['pipeline']
+        ):
+            journal = RunJournal(self.config['pipeline']['journalFile'])
+            journal.begin()
+
+        if databases is None:
+            databases = self.notion.get_databases()
+
+        if epic_ids is None:
+            epic_ids = {}
+
+        workers = 1
+        if 'pipeline' in self.config and 'databaseWorkers' in self.config['pipeline']:
+            workers = self.config['pipeline']['databaseWorkers']
+
+        # Every database is an independent job, so one failing board does not
+        # stop the others.
+        try:
+            with metrics.phase('total'):
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(
+                        lambda database: self.sync_database(
+                            database,
+                            epic_ids.get(self.notion.get_database_key(database)),
+                            journal
+                        ),
+                        databases
+                    ))
+        finally:
+            self.todo.save()
+
+        if journal is not None and all(result['status'] == 'ok' for result in results):
+            journal.finish()
+
+        for result in results:
+            metrics.increment('jobs', result['status'])
+            print(
+                f"{result['name']}: {result['status']}, {result['epics']} epics "
+                f"in {result['seconds']}s" +
+                (f" ({result['error']})" if result['error'] else '')
+            )
+
+        print(f"Notion requests: {self.notion.session.scheduler.stats()}")
+        print(f"Todoist requests: {self.todo.session.scheduler.stats()}")
+
+        self.write_metrics()
+
+        return results
+
+    def sync_pages(self, page_ids: list):
+        # Syncs only the epics the given Notion pages belong to.
+        pages = self.notion.get_event_pages(page_ids)
+
+        epic_ids = {}
+        for database in self.notion.get_databases():
+            database_epic_ids = self.notion.get_page_epic_ids(database, pages)
+            if database_epic_ids:
+                epic_ids[self.notion.get_database_key(database)] = database_epic_ids
+
+        if not epic_ids:
+            print(f"No synced epics affected by {len(page_ids)} changed pages")
+            return []
+
+        # The receiver runs for a long time; catch up on Todoist changes
+        # made since the last batch of events.
+        self.todo.state.load()
+
+        return self.sync(
+            databases=[
+                database for database in self.notion.get_databases()
+                if self.notion.get_database_key(database) in epic_ids
+            ],
+            epic_ids=epic_ids
+        )
+
+    def sync_database(self, database: dict, epic_ids: set = None, journal: RunJournal = None):
+        started = time.perf_counter()
+        result = {
+            'name': database['name'],
+            'status': 'ok',
+            'epics': 0,
+            'error': None
+        }
+
+        skip_epic_ids = None
+        watermark = None
+        if journal is not None:
+            database_key = self.notion.get_database_key(database)
+            if journal.database_done(database_key):
+                print(f"{database['name']} was already synced by the resumed run")
+                result['seconds'] = 0
+                return result
+
+            skip_epic_ids = journal.done_epic_ids(database_key)
+            if skip_epic_ids:
+                print(f"Skipping {len(skip_epic_ids)} epics already synced in {database['name']}")
+                watermark = journal.started
+
+        queue_size = 4
+        if 'pipeline' in self.config and 'queueSize' in self.config['pipeline']:
+            queue_size = self.config['pipeline']['queueSize']
+
+        # Epics are written to Todoist on a separate thread while the next
+        # ones are still being fetched from Notion.
+        epics = queue.Queue(maxsize=queue_size)
+        failures = []
+        writer = threading.Thread(
+            target=self.write_epics,
+            args=(self.todo.create_job(), epics, failures, result, journal)
+        )
+
+        writer.start()
+        try:
+            with metrics.phase('notion'):
+                for item in self.notion.stream_project(database, epic_ids, skip_epic_ids, watermark):
+                    if failures:
+                        break
 
-            for epic in project['sub_projects']:
-                self.todo.set_sub_project(epic)
-                self.todo.set_sections(project['statuses'])
+                    epics.put(item)
+        except Exception as error:
+            failures.append(error)
+        finally:
+            epics.put(None)
+            writer.join()
 
-                for story in epic['stories']:
-                    complete = False
-                    task_tag = "Notion-Issue"
+        if failures:
+            result['status'] = 'failed'
+            result['error'] = f"{type(failures[0]).__name__}: {failures[0]}"
+            traceback.print_exception(failures[0])
 
-                    if 'complete' in project:
-                        complete = project['complete']
+        result['seconds'] = round(time.perf_counter() - started, 3)
 
-                    if 'taskTag' in project:
-                        task_tag = project['taskTag']
+        return result
 
-                    self.todo.create_todoist_task(
-                        task=story,
-                        statuses=project['statuses'],
-                        complete=complete,
-                        tag_name=task_tag
-                    )
+    def write_epics(
+            self,
+            todo: Todoist,
+            epics: queue.Queue,
+            failures: list,
+            result: dict,
+            journal: RunJournal = None
+    ):
+        started = False
 
-            print('All Done')
+        while True:
+            item = epics.get()
+            if item is None:
+                return
+
+            # Keep draining after a failure so the fetching side never
+            # blocks on a full queue.
+            if failures:
+                continue
+
+            project, epic = item
+            try:
+                with metrics.phase('todoist'):
+                    if not started:
+                        todo.start_project(project)
+                        started = True
+
+                    if epic is not None:
+                        todo.write_epic(project, epic)
+                        result['epics'] += 1
+
+                        if journal is not None:
+                            journal.commit_epic(project['database_key'], epic['epic_id'], {
+                                'project_id': todo.get_epic_project_id(epic)
+                            })
+                    else:
+                        todo.finish_project(project)
+                        self.notion.save_watermark(project)
+
+                        if journal is not None:
+                            journal.commit_database(project['database_key'])
+
+                        print(f"All Done with {project['name']}")
+            except Exception as error:
+                failures.append(error)
+
+    def write_metrics(self):
+        metrics.add_counters('notion_scheduler', self.notion.session.scheduler.stats())
+        metrics.add_counters('todoist_scheduler', self.todo.session.scheduler.stats())
+
+        if 'metrics' not in self.config:
+            return
+
+        metrics_format = 'json'
+        if 'format' in self.config['metrics']:
+            metrics_format = self.config['metrics']['format']
+
+        metrics.write(self.config['metrics']['file'], metrics_format)
+        print(f"Metrics written to {self.config['metrics']['file']}")
+
+    def dry_run(self):
+        plan = Planner(self.todo).plan(self.notion.get_projects())
+        dumpToFile('plan', plan)
+
+        for operation_type, count in sorted(plan['counts'].items()):
+            print(f"{operation_type}: {count}")
+
+        print(
+            f"Estimated Todoist calls: {plan['estimatedCalls']['rest']} over REST, "
+            f"{plan['estimatedCalls']['sync']} with batched writes"
+        )
+        print('Plan written to plan.json')
+
+    def watch(self):
+        # Cached responses would hide the changes being polled for.
+        self.notion.cache = None
+
+        watcher = Watcher(self, self.config.get('watch'))
+        signal.signal(signal.SIGTERM, lambda *_: watcher.stop())
+
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.notion.close()
+
+    def listen(self):
+        self.notion.cache = None
+
+        receiver = WebhookReceiver(self, self.config.get('webhook'))
+        signal.signal(signal.SIGTERM, lambda *_: receiver.stop())
+
+        try:
+            receiver.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            receiver.server_close()
+            self.notion.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Sync Notion databases into Todoist.')
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Ignore the local Notion response cache for this run'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Write the planned Todoist operations to plan.json instead of applying them'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep running and poll each database for changes'
+    )
+    parser.add_argument(
+        '--webhook',
+        action='store_true',
+        help='Keep running and sync pages as Notion webhook events arrive'
+    )
+
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    main = Main()
-    main.sync()
+    args = parse_args()
+    main = Main(no_cache=args.no_cache)
+
+    if args.dry_run:
+        main.dry_run()
+    elif args.watch:
+        main.watch()
+    elif args.webhook:
+        main.listen()
+    elif any(result['status'] != 'ok' for result in main.sync()):
+        sys.exit(1)
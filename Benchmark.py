@@ -0,0 +1,129 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import time
+import tracemalloc
+
+import requests
+
+from ApiRequest import Main
+from FakeServer import FakeBoard, FakeServer
+
+
+def serve(queue, board_options: dict, latency: float, max_page_size: int):
+    board = FakeBoard(**board_options)
+    server = FakeServer(board, latency=latency, max_page_size=max_page_size)
+    queue.put((server.url, board.database_config()))
+    server.serve_forever()
+
+
+def get_config(url: str, database: dict, args):
+    database = dict(database, bulkFetch=args.bulk)
+
+    return {
+        'notion': {
+            'api': '2022-06-28',
+            'secret': 'benchmark',
+            'url': url + 'v1/',
+            'databases': [database],
+            'maxConcurrency': args.concurrency,
+            'poolSize': max(10, args.concurrency),
+            'pageSize': args.page_size,
+            'rateLimit': args.rate_limit,
+            'burst': args.rate_limit
+        },
+        'todoist': {
+            'secret': 'benchmark',
+            'restUrl': url + 'rest/v2/',
+            'syncUrl': url + 'sync/v9/',
+            'batchWrites': args.batch_writes,
+            'reconcile': args.reconcile,
+            'rateLimit': args.rate_limit,
+            'burst': args.rate_limit
+        }
+    }
+
+
+def run(args):
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve,
+        args=(
+            queue,
+            {
+                'epics': args.epics,
+                'stories': args.stories,
+                'sub_tasks': args.sub_tasks,
+                'comments': args.comments
+            },
+            args.latency,
+            args.page_size
+        ),
+        daemon=True
+    )
+    server.start()
+
+    try:
+        url, database = queue.get(timeout=30)
+        config = get_config(url, database, args)
+
+        runs = []
+        for _ in range(args.runs):
+            tracemalloc.start()
+            started = time.perf_counter()
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                main = Main(config=config)
+                main.sync()
+
+            wall_time = time.perf_counter() - started
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            runs.append({
+                'wallTime': round(wall_time, 3),
+                'peakMemory': peak_memory,
+                'notion': main.notion.session.scheduler.stats(),
+                'todoist': main.todo.session.scheduler.stats()
+            })
+
+        return {
+            'runs': runs,
+            'server': requests.get(url + '_stats').json()
+        }
+    finally:
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark Main.sync against a local Notion and Todoist stand-in.'
+    )
+    parser.add_argument('--epics', type=int, default=10)
+    parser.add_argument('--stories', type=int, default=10)
+    parser.add_argument('--sub-tasks', type=int, default=3)
+    parser.add_argument('--comments', type=int, default=2)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds added to every response')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--rate-limit', type=float, default=1000)
+    parser.add_argument('--bulk', action='store_true', help='Enable bulkFetch on the board')
+    parser.add_argument('--batch-writes', action='store_true')
+    parser.add_argument('--reconcile', action='store_true')
+    parser.add_argument('--runs', type=int, default=1, help='Syncs to run against the same server')
+    parser.add_argument('--output', help='Also write the report to this JSON file')
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=4))
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,604 @@
+import argparse
+import collections
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STATUSES = ['Backlog', 'Ready', 'In Progress', 'Code Review', 'Complete']
+
+
+class FakeBoard:
+    # A synthetic sprint board: one epic database and one child database
+    # holding both stories and their sub-tasks.
+
+    def __init__(self, epics=10, stories=10, sub_tasks=3, comments=2, seed=0):
+        self.random = random.Random(seed)
+        self.epic_db = self.new_id()
+        self.child_db = self.new_id()
+        self.pages = {}
+        self.databases = {self.epic_db: [], self.child_db: []}
+        self.comments = {}
+
+        for epic_number in range(epics):
+            epic = self.add_page(self.epic_db, f"Sprint {epic_number}", {
+                'Sprint ID': self.unique_id('SPR', epic_number),
+                'Dates': {'type': 'date', 'date': {'start': '2024-01-01', 'end': '2024-01-14'}}
+            }, comments=0)
+
+            for story_number in range(stories):
+                story = self.add_page(
+                    self.child_db,
+                    f"Story {epic_number}.{story_number}",
+                    self.task_properties(story_number, sprint=epic['id']),
+                    comments=comments
+                )
+
+                for task_number in range(sub_tasks):
+                    self.add_page(
+                        self.child_db,
+                        f"Task {epic_number}.{story_number}.{task_number}",
+                        self.task_properties(task_number, parent=story['id']),
+                        comments=comments
+                    )
+
+    def new_id(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    @staticmethod
+    def unique_id(prefix: str, number: int):
+        return {'type': 'unique_id', 'unique_id': {'prefix': prefix, 'number': number}}
+
+    @staticmethod
+    def rich_text(content: str):
+        return [{
+            'type': 'text',
+            'text': {'content': content},
+            'annotations': {'bold': False, 'italic': False, 'code': False},
+            'href': None
+        }]
+
+    def task_properties(self, number: int, sprint=None, parent=None):
+        return {
+            'Task ID': self.unique_id('TSK', number),
+            'Status': {'type': 'status', 'status': {'name': STATUSES[number % len(STATUSES)]}},
+            'Assignee': {'type': 'people', 'people': [{'name': 'Ada'}, {'name': 'Grace'}]},
+            'Priority': {'type': 'select', 'select': {'name': 'High'}},
+            'Estimates': {'type': 'number', 'number': number + 1},
+            'Tags': {'type': 'multi_select', 'multi_select': [{'name': 'api'}, {'name': 'ui'}]},
+            'Release': {'type': 'select', 'select': None},
+            'Start Date': {'type': 'date', 'date': {'start': '2024-01-02', 'end': None}},
+            'Summary': {'type': 'rich_text', 'rich_text': self.rich_text(f"Summary of item {number}")},
+            'Sprint': {'type': 'relation', 'relation': [{'id': sprint}] if sprint else []},
+            'Parent-task': {'type': 'relation', 'relation': [{'id': parent}] if parent else []},
+        }
+
+    def add_page(self, db_id: str, name: str, properties: dict, comments: int):
+        page_id = self.new_id()
+        page = {
+            'object': 'page',
+            'id': page_id,
+            'url': f"https://www.notion.so/{name.replace(' ', '-')}-{page_id.replace('-', '')}",
+            'parent': {'type': 'database_id', 'database_id': db_id},
+            'last_edited_time': '2024-01-01T00:00:00.000Z',
+            'properties': dict(properties, Name={
+                'type': 'title',
+                'title': [{'plain_text': name}]
+            })
+        }
+
+        self.pages[page_id] = page
+        self.databases[db_id].append(page)
+        self.comments[page_id] = [
+            {'id': self.new_id(), 'rich_text': self.rich_text(f"Comment {number} on {name}")}
+            for number in range(comments)
+        ]
+
+        return page
+
+    @property
+    def property_names(self):
+        return {
+            self.get_property_id(name): name
+            for pages in self.databases.values()
+            for page in pages
+            for name in page['properties']
+        }
+
+    @staticmethod
+    def get_property_id(name: str):
+        return hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+
+    def get_schema(self, db_id: str):
+        properties = {}
+        for page in self.databases[db_id]:
+            for name, value in page['properties'].items():
+                properties[name] = {'id': self.get_property_id(name), 'name': name, 'type': value['type']}
+
+        return {'object': 'database', 'id': db_id, 'properties': properties}
+
+    def database_config(self):
+        return {
+            'name': 'Benchmark Board',
+            'id': self.epic_db,
+            'parentDBID': self.child_db,
+            'filter': {'property': 'Sprint ID', 'unique_id': {'greater_than': -1}},
+            'pageNameField': 'Name',
+            'storyName': 'Name',
+            'parentField': 'Sprint',
+            'taskParent': 'Parent-task',
+            'statuses': STATUSES,
+            'complete': ['Complete'],
+            'colors': {'main': 'berry_red', 'sub': 'blue'},
+            'fields': {
+                'epic': ['Sprint ID', 'Dates'],
+                'story': ['Task ID', 'Assignee', 'Status', 'Estimates', 'Priority', 'Release', 'Tags'],
+                'task': ['Task ID', 'Status', 'Estimates', 'Tags', 'Priority', 'Release']
+            }
+        }
+
+
+def matches_filter(page: dict, page_filter: dict):
+    if not page_filter:
+        return True
+
+    if 'and' in page_filter:
+        return all(matches_filter(page, item) for item in page_filter['and'])
+
+    if 'or' in page_filter:
+        return any(matches_filter(page, item) for item in page_filter['or'])
+
+    if 'timestamp' in page_filter:
+        condition = page_filter[page_filter['timestamp']]
+        edited = datetime.fromisoformat(page[page_filter['timestamp']].replace('Z', '+00:00'))
+        return edited >= datetime.fromisoformat(condition['on_or_after'])
+
+    if page_filter['property'] not in page['properties']:
+        return False
+
+    prop = page['properties'][page_filter['property']]
+
+    if 'relation' in page_filter:
+        ids = [relation['id'] for relation in prop['relation']]
+        condition = page_filter['relation']
+
+        if 'contains' in condition:
+            return condition['contains'] in ids
+        if 'is_not_empty' in condition:
+            return bool(ids)
+        if 'is_empty' in condition:
+            return not ids
+
+    if 'unique_id' in page_filter:
+        number = prop['unique_id']['number']
+        condition = page_filter['unique_id']
+
+        if 'equals' in condition:
+            return number == condition['equals']
+        if 'greater_than' in condition:
+            return number > condition['greater_than']
+        if 'less_than' in condition:
+            return number < condition['less_than']
+
+    # Other property filters are accepted as matching everything.
+    return True
+
+
+class TodoistStore:
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.projects = {}
+        self.sections = {}
+        self.tasks = {}
+        self.comments = {}
+
+    def next_id(self):
+        return str(next(self.ids))
+
+    def add_project(self, args: dict):
+        project = {
+            'id': self.next_id(),
+            'name': args['name'],
+            'parent_id': args.get('parent_id'),
+            'color': args.get('color', 'charcoal'),
+            'comment_count': 0,
+            'is_favorite': False,
+            'is_shared': False,
+            'order': len(self.projects),
+            'url': '',
+            'view_style': 'list'
+        }
+        self.projects[project['id']] = project
+
+        return project
+
+    def delete_project(self, project_id: str):
+        doomed = {project_id}
+        doomed.update(
+            child_id for child_id, child in self.projects.items()
+            if child['parent_id'] == project_id
+        )
+
+        for doomed_id in doomed:
+            self.projects.pop(doomed_id, None)
+
+        for store in (self.sections, self.tasks):
+            for key in [key for key, item in store.items() if item['project_id'] in doomed]:
+                del store[key]
+
+    def add_section(self, args: dict):
+        section = {
+            'id': self.next_id(),
+            'name': args['name'],
+            'project_id': args['project_id'],
+            'order': args.get('order', args.get('section_order', len(self.sections)))
+        }
+        section['section_order'] = section['order']
+        self.sections[section['id']] = section
+
+        return section
+
+    @staticmethod
+    def get_due(due_string):
+        if not due_string or due_string == 'no date':
+            return None
+
+        return {'date': due_string[:10], 'string': due_string, 'is_recurring': False}
+
+    def add_task(self, args: dict):
+        project_id = args.get('project_id')
+        section_id = args.get('section_id')
+        if args.get('parent_id'):
+            parent = self.tasks[args['parent_id']]
+            project_id = parent['project_id']
+            section_id = parent['section_id']
+
+        due = None
+        if args.get('due'):
+            due = self.get_due(args['due']['string'])
+        elif 'due_string' in args:
+            due = self.get_due(args['due_string'])
+
+        task = {
+            'id': self.next_id(),
+            'content': args['content'],
+            'description': args.get('description', ''),
+            'labels': args.get('labels', []),
+            'project_id': project_id,
+            'section_id': section_id,
+            'parent_id': args.get('parent_id'),
+            'due': due,
+            'is_completed': False,
+            'comment_count': 0,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'creator_id': '1',
+            'order': len(self.tasks),
+            'priority': 1,
+            'url': ''
+        }
+        self.tasks[task['id']] = task
+
+        return task
+
+    def update_task(self, task_id: str, args: dict):
+        task = self.tasks[task_id]
+
+        for key, value in args.items():
+            if key == 'due_string':
+                task['due'] = self.get_due(value)
+            elif key != 'id':
+                task[key] = value
+
+    def move_task(self, args: dict):
+        task = self.tasks[args['id']]
+
+        if 'section_id' in args:
+            task['section_id'] = args['section_id']
+            task['project_id'] = self.sections[args['section_id']]['project_id']
+        elif 'project_id' in args:
+            task['project_id'] = args['project_id']
+            task['section_id'] = None
+        elif 'parent_id' in args:
+            task['parent_id'] = args['parent_id']
+
+    def add_comment(self, args: dict):
+        comment = {
+            'id': self.next_id(),
+            'content': args['content'],
+            'task_id': args.get('task_id') or args.get('item_id'),
+            'project_id': args.get('project_id'),
+            'posted_at': datetime.now(timezone.utc).isoformat()
+        }
+        self.comments[comment['id']] = comment
+
+        return comment
+
+    def read_resources(self):
+        # Always a full sync; the stand-in keeps no change history.
+        return {
+            'full_sync': True,
+            'sync_token': self.next_id(),
+            'projects': list(self.projects.values()),
+            'sections': list(self.sections.values()),
+            'items': [
+                dict(task, checked=task['is_completed']) for task in self.tasks.values()
+            ],
+            'labels': []
+        }
+
+    def run_command(self, command: dict, mapping: dict):
+        args = {
+            key: mapping.get(value, value) if isinstance(value, str) else value
+            for key, value in command['args'].items()
+        }
+
+        created = None
+        if command['type'] == 'project_add':
+            created = self.add_project(args)
+        elif command['type'] == 'project_delete':
+            self.delete_project(args['id'])
+        elif command['type'] == 'section_add':
+            created = self.add_section(args)
+        elif command['type'] == 'section_reorder':
+            for order in args['sections']:
+                section = self.sections[order['id']]
+                section['order'] = section['section_order'] = order['section_order']
+        elif command['type'] == 'item_add':
+            created = self.add_task(args)
+        elif command['type'] == 'item_update':
+            if 'due' in args:
+                args['due'] = self.get_due(args['due']['string']) if args['due'] else None
+            self.update_task(args['id'], args)
+        elif command['type'] == 'item_move':
+            self.move_task(args)
+        elif command['type'] == 'item_close':
+            self.tasks[args['id']]['is_completed'] = True
+        elif command['type'] == 'item_delete':
+            self.tasks.pop(args['id'], None)
+        elif command['type'] == 'note_add':
+            created = self.add_comment(args)
+        else:
+            return {'error': f"Unknown command {command['type']}"}
+
+        if created is not None and 'temp_id' in command:
+            mapping[command['temp_id']] = created['id']
+
+        return 'ok'
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, board: FakeBoard, latency: float = 0.0, max_page_size: int = 100, port: int = 0):
+        super().__init__(('127.0.0.1', port), FakeHandler)
+        self.board = board
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.todoist = TodoistStore()
+        self.requests = collections.Counter()
+        self.bytes_sent = 0
+        self.lock = threading.RLock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/"
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'bytesSent': self.bytes_sent,
+                'todoist': {
+                    'projects': len(self.todoist.projects),
+                    'sections': len(self.todoist.sections),
+                    'tasks': len(self.todoist.tasks),
+                    'comments': len(self.todoist.comments)
+                }
+            }
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    server: FakeServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def handle_request(self, method: str):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = {
+            key: values if key == 'filter_properties' else values[0]
+            for key, values in parse_qs(url.query).items()
+        }
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        if parts and parts[0] != '_stats' and self.server.latency:
+            time.sleep(self.server.latency)
+
+        with self.server.lock:
+            endpoint, status, payload = self.route(method, parts, query, body)
+            self.server.requests[f"{method} {endpoint}"] += 1
+
+        data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+        with self.server.lock:
+            self.server.bytes_sent += len(data)
+
+    def route(self, method: str, parts: list, query: dict, body: bytes):
+        if parts == ['_stats']:
+            return '_stats', 200, self.server.stats()
+
+        if parts[:1] == ['v1']:
+            return self.route_notion(method, parts[1:], query, body)
+
+        if parts[:2] == ['rest', 'v2']:
+            return self.route_rest(method, parts[2:], query, body)
+
+        if parts[:3] == ['sync', 'v9', 'sync'] and method == 'POST':
+            form = parse_qs(body.decode('utf-8'))
+            if 'resource_types' in form:
+                return 'todoist/sync_read', 200, self.server.todoist.read_resources()
+
+            commands = json.loads(form['commands'][0])
+            mapping = {}
+            status = {
+                command['uuid']: self.server.todoist.run_command(command, mapping)
+                for command in commands
+            }
+            return 'todoist/sync', 200, {'sync_status': status, 'temp_id_mapping': mapping}
+
+        return 'unknown', 404, {'error': 'not found'}
+
+    def route_notion(self, method: str, parts: list, query: dict, body: bytes):
+        board = self.server.board
+
+        if method == 'POST' and len(parts) == 3 and parts[0] == 'databases':
+            request = json.loads(body or b'{}')
+            results = [
+                page for page in board.databases.get(parts[1], [])
+                if matches_filter(page, request.get('filter'))
+            ]
+
+            if 'filter_properties' in query:
+                names = {board.property_names[property_id] for property_id in query['filter_properties']}
+                results = [
+                    dict(page, properties={
+                        name: value for name, value in page['properties'].items() if name in names
+                    })
+                    for page in results
+                ]
+
+            return 'notion/databases/query', 200, self.paginate(results, request)
+
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'databases':
+            return 'notion/databases', 200, board.get_schema(parts[1])
+
+        if method == 'GET' and parts == ['comments']:
+            return 'notion/comments', 200, self.paginate(
+                board.comments.get(query.get('block_id'), []),
+                query
+            )
+
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'pages':
+            return 'notion/pages', 200, board.pages[parts[1]]
+
+        return 'notion/unknown', 404, {'object': 'error'}
+
+    def paginate(self, results: list, request: dict):
+        page_size = min(int(request.get('page_size') or 100), self.server.max_page_size)
+        start = int(request.get('start_cursor') or 0)
+        end = start + page_size
+
+        return {
+            'object': 'list',
+            'results': results[start:end],
+            'has_more': end < len(results),
+            'next_cursor': str(end) if end < len(results) else None
+        }
+
+    def route_rest(self, method: str, parts: list, query: dict, body: bytes):
+        store = self.server.todoist
+        args = json.loads(body) if body else {}
+        resource = parts[0]
+        endpoint = f"todoist/{resource}"
+
+        if method == 'GET' and len(parts) == 1:
+            if resource == 'projects':
+                return endpoint, 200, list(store.projects.values())
+            if resource == 'sections':
+                return endpoint, 200, [
+                    section for section in store.sections.values()
+                    if 'project_id' not in query or section['project_id'] == query['project_id']
+                ]
+            if resource == 'tasks':
+                return endpoint, 200, [
+                    task for task in store.tasks.values()
+                    if not task['is_completed'] and
+                    ('project_id' not in query or task['project_id'] == query['project_id'])
+                ]
+            if resource == 'comments':
+                return endpoint, 200, [
+                    comment for comment in store.comments.values()
+                    if comment['task_id'] == query.get('task_id') and
+                    comment['project_id'] == query.get('project_id')
+                ]
+
+        if method == 'POST' and len(parts) == 1:
+            if resource == 'projects':
+                return endpoint, 200, store.add_project(args)
+            if resource == 'sections':
+                return endpoint, 200, store.add_section(args)
+            if resource == 'tasks':
+                return endpoint, 200, store.add_task(args)
+            if resource == 'comments':
+                return endpoint, 200, store.add_comment(args)
+
+        if method == 'POST' and resource == 'tasks' and len(parts) == 2:
+            store.update_task(parts[1], args)
+            return endpoint, 204, None
+
+        if method == 'POST' and resource == 'tasks' and parts[2:] == ['close']:
+            store.tasks[parts[1]]['is_completed'] = True
+            return endpoint, 204, None
+
+        if method == 'DELETE' and resource == 'tasks':
+            store.tasks.pop(parts[1], None)
+            return endpoint, 204, None
+
+        if method == 'DELETE' and resource == 'projects':
+            store.delete_project(parts[1])
+            return endpoint, 204, None
+
+        return 'todoist/unknown', 404, {'error': 'not found'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a synthetic Notion board and a fake Todoist.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--epics', type=int, default=10)
+    parser.add_argument('--stories', type=int, default=10)
+    parser.add_argument('--sub-tasks', type=int, default=3)
+    parser.add_argument('--comments', type=int, default=2)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    board = FakeBoard(
+        epics=args.epics,
+        stories=args.stories,
+        sub_tasks=args.sub_tasks,
+        comments=args.comments
+    )
+    server = FakeServer(board, latency=args.latency, max_page_size=args.page_size, port=args.port)
+
+    print(f"Serving on {server.url}")
+    print(json.dumps(board.database_config(), indent=4))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import threading
+
+from util import getStateFile, saveStateFile
+
+
+class FingerprintStore:
+    # Content hashes of what was last written to Todoist, keyed by board and
+    # Notion page ID. A page whose hash has not changed needs no writes, and a
+    # comment whose Notion ID is already recorded for its page is not posted
+    # again. Both are only recorded once the writes behind them succeed.
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+
+        state = getStateFile(name, {})
+        self.pages = state.get('pages', {})
+        self.comments = {
+            page_key: set(comment_keys)
+            for page_key, comment_keys in state.get('comment_ids', {}).items()
+        }
+
+    def save(self):
+        with self.lock:
+            saveStateFile(self.name, {
+                'pages': self.pages,
+                'comment_ids': {
+                    page_key: sorted(comment_keys) for page_key, comment_keys in self.comments.items()
+                }
+            })
+
+    def unchanged(self, page_key: str, fingerprint: str):
+        with self.lock:
+            return self.pages.get(page_key) == fingerprint
+
+    def has_comments(self, page_key: str):
+        with self.lock:
+            return page_key in self.comments
+
+    def new_comments(self, page_key: str, comments: list):
+        with self.lock:
+            known = self.comments.get(page_key, set())
+
+        return [comment for comment in comments if self.get_comment_key(comment) not in known]
+
+    def record(self, pages: dict, comments: dict):
+        with self.lock:
+            self.pages.update(pages)
+
+            for page_key, page_comments in comments.items():
+                self.comments.setdefault(page_key, set()).update(
+                    self.get_comment_key(comment) for comment in page_comments
+                )
+
+    @staticmethod
+    def get_page_key(database_key: str, page_key: str):
+        # Boards that share a database write their own copy of each page.
+        return f"{database_key}/{page_key}"
+
+    @staticmethod
+    def get_comment_key(comment: dict):
+        # Comments made from page properties have no ID of their own.
+        if comment['id']:
+            return comment['id']
+
+        return FingerprintStore.get_hash(comment['content'])
+
+    @staticmethod
+    def get_hash(value):
+        return hashlib.sha1(
+            json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+
+    @staticmethod
+    def task_fingerprint(task: dict):
+        return FingerprintStore.get_hash({
+            'name': task['name'],
+            'description': task['description'],
+            'status': task['status'],
+            'start_date': task['start_date'],
+            'sub_tasks': [
+                {
+                    'id': sub_task['task_id'],
+                    'name': sub_task['name'],
+                    'description': sub_task['description'],
+                    'status': sub_task['status']
+                }
+                for sub_task in task['sub_tasks']
+            ]
+        })
+
+    @staticmethod
+    def epic_fingerprint(project: dict, epic: dict):
+        return FingerprintStore.get_hash({
+            'statuses': project['statuses'],
+            'complete': project.get('complete'),
+            'taskTag': project.get('taskTag'),
+            'name': epic['name'],
+            'color': epic['color'],
+            'comment': epic['comment'],
+            'stories': [
+                [story['story_id'], FingerprintStore.task_fingerprint(story), story['comments']]
+                for story in epic['stories']
+            ]
+        })
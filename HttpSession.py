@@ -0,0 +1,76 @@
+import functools
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Metrics import metrics
+from RequestScheduler import RequestScheduler
+
+
+class HttpSession(requests.Session):
+
+    def __init__(
+            self,
+            config: dict,
+            name='http',
+            idempotent_methods=None,
+            rate: float = 3,
+            burst: float = None
+    ):
+        super().__init__()
+        self.name = name
+
+        if idempotent_methods is None:
+            self.scheduler = RequestScheduler(config, rate=rate, burst=burst)
+        else:
+            self.scheduler = RequestScheduler(config, idempotent_methods, rate=rate, burst=burst)
+
+        self.timeout = (5, 30)
+        if 'timeout' in config and isinstance(config['timeout'], list):
+            self.timeout = tuple(config['timeout'])
+        elif 'timeout' in config:
+            self.timeout = config['timeout']
+
+        pool_size = 10
+        if 'poolSize' in config:
+            pool_size = config['poolSize']
+
+        self.url_prefixes = {}
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        for prefix, replacement in self.url_prefixes.items():
+            if url.startswith(prefix):
+                url = replacement + url[len(prefix):]
+
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+
+        return self.scheduler.request(
+            send=functools.partial(self.send_request, method, url, *args, **kwargs),
+            method=method
+        )
+
+    def send_request(self, method, url, *args, **kwargs):
+        name = f"{self.name} {method.upper()} {metrics.get_endpoint(urlparse(url).path)}"
+        started = time.perf_counter()
+
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            metrics.increment('errors', name)
+            raise
+        finally:
+            metrics.observe('request', name, time.perf_counter() - started)
+
+        metrics.increment('requests', name)
+        metrics.increment('bytes_received', name, len(response.content))
+        if response.request.body:
+            metrics.increment('bytes_sent', name, len(response.request.body))
+
+        return response
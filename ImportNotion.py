@@ -1,101 +1,186 @@
+import argparse
+import collections
 import csv
-import todoist
-import pprint as pp
+import os
+
+from Todoist import Todoist
+from TodoistWriter import SyncWriter
+from util import getJsonFile
+
+SECTIONS = ['To Do', 'In Progress', 'Pending', 'Pending Release', 'Complete']
 
 
 def main():
-    tickets = []
-    print("\033[93m Make sure you file is in Downloads/notion/PageName.csv!\033[0m \n\n")
-    project = {
-        'name': input("Enter the top level page name:\n"),
-        'tasks': {}
-    }
-
-    with open(f'../../Downloads/notion/{project["name"]}.csv', mode='r',
-              encoding='utf-8-sig') as csv_file:
-        csv_reader = csv.DictReader(csv_file)
+    args = parse_args()
+
+    name = args.name
+    if name is None:
+        name = os.path.splitext(os.path.basename(args.path))[0]
+
+    # The import only creates a new project, so the account is never read
+    # and nothing written is kept in a state index.
+    todo = Todoist(getJsonFile('config')['todoist'], load_state=False)
+    writer = SyncWriter(todo.sync_commands, batch_size=args.batch_size)
+
+    importer = CsvImport(writer, name)
+    with open(args.path, mode='r', encoding='utf-8-sig', newline='') as csv_file:
+        importer.run(csv.DictReader(csv_file))
+
+
+class CsvImport:
+    # Rows are written as they are read. A sub-task that comes before its
+    # parent waits in a hash index keyed by the parent's name, so only the
+    # parent names, their descriptions and those early rows stay in memory.
+    # Once a batch is sent the temp ids held here are swapped for real ones
+    # at the end of the row, and the writer forgets its temp id mapping.
+
+    def __init__(self, writer: SyncWriter, name: str):
+        self.writer = writer
+        self.name = name
+        self.project_id = None
+        self.sections = {}
+        self.parents = {}
+        self.unresolved = []
+        self.pending = collections.defaultdict(list)
+
+    def run(self, rows):
+        print(f"Creating Project: {self.name}")
+        self.project_id = self.writer.add('project_add', {'name': self.name})
+
+        for order, status in enumerate(SECTIONS, start=1):
+            self.sections[status] = self.writer.add('section_add', {
+                'name': status,
+                'project_id': self.project_id,
+                'section_order': order
+            })
+
         line_count = 0
-        for row in csv_reader:
-            if row['Parent Name'] == project['name']:
-                project['tasks'][row['Name']] = row
-                project['tasks'][row['Name']]['subtasks'] = {}
-            else:
-                tickets.append(row)
+        for row in rows:
             line_count += 1
-        print(f'Processed {line_count} lines.')
 
-    for key in project['tasks'].keys():
-        for ticket in tickets:
-            if ticket['Parent Name'] == key:
-                project['tasks'][key]['subtasks'][ticket['Name']] = ticket
+            if row['Parent Name'] == self.name:
+                self.add_task(row)
+            elif row['Parent Name'] in self.parents:
+                self.add_sub_task(row, row['Parent Name'])
+            else:
+                self.pending[row['Parent Name']].append(row)
 
-    createLeverageTodoistProject(project)
+            # Only rows in flight can hold temp ids from a batch already sent.
+            if self.writer.ids:
+                self.release_ids()
 
+        print(f'Processed {line_count} lines.')
 
-def createLeverageTodoistProject(project):
-    api = todoist.TodoistAPI('579ee6ae923cad35b3f8818a363cac294d2b7d4a')
+        # Only sub-tasks of top-level tasks are imported.
+        skipped = sum(len(rows) for rows in self.pending.values())
+        if skipped:
+            print(f"Skipped {skipped} rows without a top-level parent")
+
+        print('Committing project to Todoist')
+        self.writer.flush()
+        print('All Done')
+
+    def release_ids(self):
+        self.project_id = self.writer.resolve(self.project_id)
+        self.sections = {
+            status: self.writer.resolve(section_id) for status, section_id in self.sections.items()
+        }
+
+        # A parent whose command is still queued keeps its temp id for now.
+        unresolved = []
+        for key in self.unresolved:
+            item_id, description = self.parents[key]
+            if item_id in self.writer.ids:
+                self.parents[key] = (self.writer.ids[item_id], description)
+            else:
+                unresolved.append(key)
 
-    print(f"Creating Project: {project['name']}")
-    todoistProject = api.projects.add(project['name'])
-    sections = {
-        'To Do': api.sections.add('To Do', project_id=todoistProject['id']),
-        'In Progress': api.sections.add('In Progress', project_id=todoistProject['id']),
-        'Pending': api.sections.add('Pending', project_id=todoistProject['id']),
-        'Pending Release': api.sections.add('Pending Release', project_id=todoistProject['id']),
-        'Complete': api.sections.add('Complete', project_id=todoistProject['id'])
-    }
+        self.unresolved = unresolved
+        self.writer.release_ids()
 
-    for key, task in project['tasks'].items():
+    def add_task(self, task: dict):
+        key = task['Name']
         print(f"Creating task {key}")
-        item = api.quick.add(f"* {key} @Notion-Issue {task['End Date']}",
-                             note=(
-                                 f"*** \n"
-                                 f"**Created:** {task['Created']}\n"
-                                 f"**Start Date:** {task['Start Date']}\n"
-                                 f"**End Date:** {task['End Date']}"
-                                 f"\n *** \n"
-                                 f"**Duration:** {task['Duration']}\n"
-                                 f"**Type:** {task['Type']}\n"
-                                 f"**Story Points:** {task['Story Points']}"
-                                 f"\n *** \n"
-                                 f"#### Description \n{task['Description']}"
-                                 f"\n *** "
-                             ))
-
-        if task['subtasks']:
-            for subkey, subtask in task['subtasks'].items():
-                subitem = api.quick.add(f"{subkey} @Task",
-                                        note=(
-                                            f"*** \n"
-                                            f"**Created:** {subtask['Created']}\n"
-                                            f"**Type:** {subtask['Type']}\n"
-                                            f"**Story Points:** {subtask['Story Points']}"
-                                            f"\n *** \n"
-                                            f"#### Description \n{task['Description']}"
-                                            f"\n *** "
-                                        ))
-
-                print(f"Adding subtask {subkey} to {key}")
-                subitem = api.items.get_by_id(subitem['id'])
-                subitem.move(parent_id=item['id'])
-
-                if subtask['Status'] == 'Complete':
-                    subitem.complete()
-
-        item = api.items.get_by_id(item['id'])
+
         section = 'To Do'
-        if task['Status']:
+        if task['Status'] in self.sections:
             section = task['Status']
 
-        print(f"Adding {key} task to the project")
-        item.move(project_id=todoistProject['id'])
-        print(f"Adding {key} to section {section}")
-        item.move(section_id=f"{sections[section]['id']}")
-
-    print('Committing project to Todoist')
-    api.commit()
-    api.reset_state()
-    print('All Done')
+        args = {
+            'content': f"* {key}",
+            'labels': ['Notion-Issue'],
+            'project_id': self.project_id,
+            'section_id': self.sections[section]
+        }
+
+        if task['End Date']:
+            args['due'] = {'string': task['End Date']}
+
+        item_id = self.writer.add('item_add', args)
+        self.writer.add('note_add', {
+            'item_id': item_id,
+            'content': (
+                f"*** \n"
+                f"**Created:** {task['Created']}\n"
+                f"**Start Date:** {task['Start Date']}\n"
+                f"**End Date:** {task['End Date']}"
+                f"\n *** \n"
+                f"**Duration:** {task['Duration']}\n"
+                f"**Type:** {task['Type']}\n"
+                f"**Story Points:** {task['Story Points']}"
+                f"\n *** \n"
+                f"#### Description \n{task['Description']}"
+                f"\n *** "
+            )
+        })
+
+        self.parents[key] = (item_id, task['Description'])
+        self.unresolved.append(key)
+
+        for sub_task in self.pending.pop(key, []):
+            self.add_sub_task(sub_task, key)
+
+    def add_sub_task(self, sub_task: dict, parent_name: str):
+        parent_id, description = self.parents[parent_name]
+        print(f"Adding subtask {sub_task['Name']} to {parent_name}")
+
+        item_id = self.writer.add('item_add', {
+            'content': sub_task['Name'],
+            'labels': ['Task'],
+            'parent_id': parent_id
+        })
+        self.writer.add('note_add', {
+            'item_id': item_id,
+            'content': (
+                f"*** \n"
+                f"**Created:** {sub_task['Created']}\n"
+                f"**Type:** {sub_task['Type']}\n"
+                f"**Story Points:** {sub_task['Story Points']}"
+                f"\n *** \n"
+                f"#### Description \n{description}"
+                f"\n *** "
+            )
+        })
+
+        if sub_task['Status'] == 'Complete':
+            self.writer.add('item_close', {'id': item_id})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Import a Notion CSV export into a new Todoist project.')
+    parser.add_argument('path', help='The CSV file exported from Notion')
+    parser.add_argument(
+        '--name',
+        help='The top level page name; defaults to the file name'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=100,
+        help='Todoist commands sent per Sync API request'
+    )
+
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,146 @@
+import bisect
+import collections
+import contextlib
+import functools
+import json
+import math
+import re
+import threading
+import time
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+ID_SEGMENT = re.compile(r'^(?=.*\d)[0-9a-fA-F-]{6,}$|^\d+$')
+
+
+class Metrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = collections.Counter()
+            self.phases = collections.Counter()
+
+    def observe(self, kind: str, name: str, seconds: float):
+        with self.lock:
+            key = (kind, name)
+            if key not in self.histograms:
+                self.histograms[key] = {'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0}
+
+            histogram = self.histograms[key]
+            histogram['buckets'][bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+
+    def increment(self, kind: str, name: str, value=1):
+        with self.lock:
+            self.counters[(kind, name)] += value
+
+    def add_counters(self, kind: str, counters: dict):
+        for name, value in counters.items():
+            self.increment(kind, name, value)
+
+    @contextlib.contextmanager
+    def timer(self, kind: str, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(kind, name, time.perf_counter() - started)
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] += time.perf_counter() - started
+
+    def timed(self, kind: str, name: str):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(kind, name, time.perf_counter() - started)
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def get_endpoint(path: str):
+        return '/'.join(
+            '{id}' if ID_SEGMENT.match(segment) else segment
+            for segment in path.strip('/').split('/')
+        )
+
+    def report(self):
+        with self.lock:
+            histograms = collections.defaultdict(dict)
+            for (kind, name), histogram in sorted(self.histograms.items()):
+                histograms[kind][name] = {
+                    'count': histogram['count'],
+                    'sum': round(histogram['sum'], 6),
+                    'buckets': {
+                        str(bucket): count
+                        for bucket, count in zip(BUCKETS, histogram['buckets'])
+                    }
+                }
+
+            counters = collections.defaultdict(dict)
+            for (kind, name), value in sorted(self.counters.items()):
+                counters[kind][name] = value
+
+            return {
+                'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+                'histograms': dict(histograms),
+                'counters': dict(counters)
+            }
+
+    def to_prometheus(self, prefix='notion_todoist'):
+        lines = []
+        with self.lock:
+            kinds = sorted({kind for kind, _ in self.histograms})
+            for kind in kinds:
+                metric = f"{prefix}_{kind}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+
+                for (histogram_kind, name), histogram in sorted(self.histograms.items()):
+                    if histogram_kind != kind:
+                        continue
+
+                    total = 0
+                    for bucket, count in zip(BUCKETS, histogram['buckets']):
+                        total += count
+                        le = '+Inf' if bucket == math.inf else str(bucket)
+                        lines.append(f'{metric}_bucket{{name="{name}",le="{le}"}} {total}')
+
+                    lines.append(f'{metric}_sum{{name="{name}"}} {histogram["sum"]}')
+                    lines.append(f'{metric}_count{{name="{name}"}} {histogram["count"]}')
+
+            lines.append(f"# TYPE {prefix}_total counter")
+            for (kind, name), value in sorted(self.counters.items()):
+                lines.append(f'{prefix}_total{{kind="{kind}",name="{name}"}} {value}')
+
+            lines.append(f"# TYPE {prefix}_phase_seconds gauge")
+            for name, seconds in sorted(self.phases.items()):
+                lines.append(f'{prefix}_phase_seconds{{phase="{name}"}} {seconds}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str, metrics_format='json'):
+        with open(path, 'w') as outfile:
+            if metrics_format == 'prometheus':
+                outfile.write(self.to_prometheus())
+            else:
+                json.dump(self.report(), outfile, indent=4)
+
+
+metrics = Metrics()
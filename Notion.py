@@ -1,6 +1,20 @@
+import collections
 import functools
-import json
+import os
 import pprint
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from HttpSession import HttpSession
+from Metrics import metrics
+from NotionPage import NotionPage
+from PropertyRenderer import PropertyRenderer, render_field, render_rich_text
+from ResponseCache import ResponseCache
+from util import Lazy, LazyDict, dumpJson, getStateFile, loadJson, saveStateFile
 
 
 class Notion:
@@ -10,167 +24,726 @@ class Notion:
         self.databases = config['databases']
         self.secret = config['secret']
         self.url = config['url']
+        # Notion only POSTs read-only queries, so they are safe to retry.
+        self.session = HttpSession(config, name='notion', idempotent_methods=('GET', 'POST'))
+        self.relation_indexes = {}
+        self.renderers = {}
+
+        # Database schemas are read once, to check the configured property
+        # names before a run and, optionally, so queries only return the
+        # properties the sync reads.
+        self.schemas = {}
+        self.checked_databases = set()
+        self.property_filters = {}
+
+        self.validate_schema = True
+        if 'validateSchema' in config:
+            self.validate_schema = config['validateSchema']
+
+        self.filter_properties = 'filterProperties' in config and config['filterProperties']
+
+        self.page_size = 100
+        if 'pageSize' in config:
+            self.page_size = config['pageSize']
+
+        self.max_concurrency = 1
+        if 'maxConcurrency' in config:
+            self.max_concurrency = config['maxConcurrency']
+
+        # Shared by every database being synced. Epics get their own pool so
+        # their story and sub-task fan-out on the main pool cannot starve them.
+        self.executor = None
+        self.epic_executor = None
+        if self.max_concurrency > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+            self.epic_executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+
+        # Query results can be trimmed to the properties the sync reads, so
+        # large boards do not keep every raw property of every page alive.
+        self.projections = {}
+        if 'compactPages' in config and config['compactPages']:
+            for database in self.get_databases():
+                property_names = self.get_property_names(database)
+                for db_id in (database['id'], self.get_child_database_id(database)):
+                    self.projections[db_id] = self.projections.get(db_id, frozenset()) | property_names
+
+        self.incremental = 'incremental' in config and config['incremental']
+
+        # Incremental runs must see pages as they are now, or the watermark
+        # would move past edits that were served from the cache.
+        self.cache = None
+        if 'cache' in config and config['cache']:
+            if self.incremental:
+                print("The response cache is not used by incremental syncs")
+            else:
+                self.cache = self.create_cache(config)
+
+        self.state_file = 'sync_state'
+        if 'stateFile' in config:
+            self.state_file = config['stateFile']
+
+        self.watermarks = {}
+        self.pending_watermarks = {}
+        self.state_lock = threading.Lock()
+        if self.incremental:
+            self.enable_incremental()
+
+    def enable_incremental(self):
+        self.incremental = True
+        self.watermarks = getStateFile(self.state_file, {}).get('watermarks', {})
 
     def get_projects(self):
         projects = []
-        for database in self.databases:
-            if "skip" in database and database["skip"]:
+        for project, sub_project in self.stream_projects():
+            if sub_project is None:
+                projects.append(project)
+            else:
+                project['sub_projects'].append(sub_project)
+
+        return projects
+
+    def stream_projects(self):
+        for database in self.get_databases():
+            yield from self.stream_project(database)
+
+    def stream_project(
+            self,
+            database: dict,
+            epic_ids: set = None,
+            skip_epic_ids: set = None,
+            watermark: str = None
+    ):
+        # Yields (project, sub_project) as soon as each epic is assembled,
+        # then (project, None) once the project has no more epics. With
+        # epic_ids only those epics are fetched, one page at a time.
+        self.check_database(database)
+        project = self.get_project(database)
+
+        if epic_ids is None:
+            sub_projects = self.stream_sub_projects(database, skip_epic_ids, watermark)
+        else:
+            sub_projects = self.stream_epics(database, epic_ids)
+
+        for sub_project in sub_projects:
+            yield project, sub_project
+
+        yield project, None
+
+    def get_databases(self):
+        return [
+            database for database in self.databases
+            if not ("skip" in database and database["skip"])
+        ]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.epic_executor.shutdown()
+
+        self.session.close()
+
+    def get_project(self, database: dict):
+        project = {
+            'database_id': database['id'],
+            'database_key': self.get_database_key(database),
+            'name': database['name'],
+            'statuses': database['statuses'],
+            'color': database['colors']['main'],
+            'sub_projects': []
+        }
+
+        if 'taskTag' in database:
+            project['taskTag'] = database['taskTag']
+
+        if 'complete' in database:
+            project['complete'] = database['complete']
+
+        return project
+
+    def stream_sub_projects(self, database: dict, skip_epic_ids: set = None, watermark: str = None):
+        print(f"Getting notion database {database['name']}")
+
+        changed_epic_ids = None
+        if self.incremental:
+            # Notion truncates last_edited_time to the minute, so the
+            # watermark is too; pages edited during this run are seen again.
+            # A resumed run keeps the watermark of the run it continues.
+            if watermark is None:
+                watermark = datetime.now(timezone.utc).replace(
+                    second=0, microsecond=0
+                ).isoformat()
+
+            database_key = self.get_database_key(database)
+            self.pending_watermarks[database_key] = watermark
+
+            if database_key in self.watermarks:
+                changed_epic_ids = self.get_changed_epic_ids(
+                    database=database,
+                    watermark=self.watermarks[database_key]
+                )
+
+        if 'bulkFetch' in database and database['bulkFetch']:
+            self.relation_indexes[self.get_database_key(database)] = self.get_relation_indexes(database)
+
+        try:
+            # Epics are assembled one result page at a time so only a single
+            # page of raw Notion objects is held in memory.
+            for notion_epics in self.iter_database(
+                    db_id=database['id'],
+                    db_filter=database['filter']
+            ):
+                if changed_epic_ids is not None:
+                    notion_epics = [
+                        epic for epic in notion_epics
+                        if epic['id'] in changed_epic_ids
+                        or epic['last_edited_time'] >= self.watermarks[database_key]
+                    ]
+
+                if skip_epic_ids:
+                    notion_epics = [epic for epic in notion_epics if epic['id'] not in skip_epic_ids]
+
+                yield from self.stream_map(
+                    lambda epic: self.get_sub_projects(database, [epic])[0],
+                    notion_epics
+                )
+        finally:
+            self.relation_indexes.pop(self.get_database_key(database), None)
+
+    def stream_epics(self, database: dict, epic_ids: set):
+        print(f"Getting {len(epic_ids)} epics from notion database {database['name']}")
+
+        # Epics are read through the database filter, so a change to an
+        # epic the full sync would skip does not bring it back.
+        epic_keys = {epic_id.replace('-', '') for epic_id in epic_ids}
+        notion_epics = [
+            epic
+            for results in self.iter_database(db_id=database['id'], db_filter=database['filter'])
+            for epic in results
+            if epic['id'].replace('-', '') in epic_keys
+        ]
+
+        yield from self.stream_map(
+            lambda epic: self.get_sub_projects(database, [epic])[0],
+            notion_epics
+        )
+
+    def get_page_epic_ids(self, database: dict, pages: list):
+        # Works out which epics of the database the given pages belong to: a
+        # story through its epic relation, a sub-task through its story, or
+        # the page itself if it sits in the epic database. The result may
+        # hold pages that are not epics; stream_epics drops them.
+        epic_db = database['id'].replace('-', '')
+        child_db = self.get_child_database_id(database).replace('-', '')
+        parent_field = self.get_parent_field(database)
+        task_parent_field = self.get_task_parent_field(database)
+
+        epic_ids = set()
+        for page in pages:
+            db_id = page.get('parent', {}).get('database_id', '').replace('-', '')
+            if db_id not in (epic_db, child_db):
+                continue
+
+            properties = page['properties']
+
+            if db_id == epic_db:
+                epic_ids.add(page['id'])
+
+            if db_id != child_db:
                 continue
 
-            print(f"Getting notion database {database['name']}")
+            if parent_field != task_parent_field and self.get_relation_ids(properties, parent_field):
+                epic_ids.update(self.get_relation_ids(properties, parent_field))
+                continue
+
+            # A sub-task points at its story. When stories and sub-tasks
+            # share the relation field the page may be a story instead, so
+            # what it points at is kept as a possible epic too.
+            for story_id in self.get_relation_ids(properties, task_parent_field):
+                if parent_field == task_parent_field:
+                    epic_ids.add(story_id)
+
+                epic_ids.update(
+                    self.get_relation_ids(self.get_page(story_id)['properties'], parent_field)
+                )
+
+        return epic_ids
+
+    @staticmethod
+    def get_relation_ids(properties: dict, field: str):
+        if field not in properties:
+            return []
+
+        return [relation['id'] for relation in properties[field]['relation']]
+
+    def get_event_pages(self, page_ids: list):
+        return [page for page in self.map(self.get_event_page, page_ids) if page is not None]
+
+    def get_event_page(self, page_id: str):
+        # Pages deleted since the event was sent are gone for good.
+        try:
+            return self.get_page(page_id)
+        except requests.HTTPError as error:
+            if error.response is not None and error.response.status_code == 404:
+                return None
+
+            raise
+
+    def get_changed_epic_ids(self, database: dict, watermark: str):
+        if self.get_override_filter(database) is not None:
+            # Stories are not linked to a single epic, so any change has to
+            # be treated as touching every epic.
+            return None
+
+        parent_field = self.get_parent_field(database)
+        task_parent_field = self.get_task_parent_field(database)
+
+        epic_ids = set()
+        story_ids = set()
+        resolved_story_ids = set()
+        for results in self.iter_database(
+                db_id=self.get_child_database_id(database),
+                db_filter={
+                    'timestamp': 'last_edited_time',
+                    'last_edited_time': {
+                        'on_or_after': watermark
+                    }
+                }
+        ):
+            for page in results:
+                properties = page['properties']
+
+                if parent_field in properties and properties[parent_field]['relation']:
+                    epic_ids.update(
+                        relation['id'] for relation in properties[parent_field]['relation']
+                    )
+                    resolved_story_ids.add(page['id'])
+
+                if task_parent_field in properties:
+                    story_ids.update(
+                        relation['id'] for relation in properties[task_parent_field]['relation']
+                    )
+
+        # Sub-tasks only point at their story, so look up the epic of any
+        # story that did not change itself.
+        for story_id in story_ids - resolved_story_ids:
+            properties = self.get_page(story_id)['properties']
+
+            if parent_field in properties:
+                epic_ids.update(
+                    relation['id'] for relation in properties[parent_field]['relation']
+                )
+
+        return epic_ids
 
-            notion_database = self.get_notion_database(
-                db_id=database['id'],
-                db_filter=database['filter']
+    def save_watermark(self, project: dict):
+        with self.state_lock:
+            if project['database_key'] not in self.pending_watermarks:
+                return
+
+            self.watermarks[project['database_key']] = \
+                self.pending_watermarks.pop(project['database_key'])
+
+            state = getStateFile(self.state_file, {})
+            state['watermarks'] = self.watermarks
+            saveStateFile(self.state_file, state)
+
+    def get_relation_indexes(self, database: dict):
+        db_id = self.get_child_database_id(database)
+        override_filter = self.get_override_filter(database)
+
+        if override_filter is not None:
+            # The override filter replaces the relation filter, so every epic
+            # shares the same set of stories.
+            stories = self.get_notion_database(db_id=db_id, db_filter=override_filter)
+            story_index = collections.defaultdict(lambda: stories['results'])
+        else:
+            story_index = self.get_relation_index(
+                db_id=db_id,
+                relation_field=self.get_parent_field(database),
+                db_filter=self.get_sub_filter(database)
             )
 
-            project = {
-                'name': database['name'],
-                'statuses': database['statuses'],
-                'color': database['colors']['main'],
-                'sub_projects': []
+        return {
+            'stories': story_index,
+            'tasks': self.get_relation_index(
+                db_id=db_id,
+                relation_field=self.get_task_parent_field(database)
+            )
+        }
+
+    def get_relation_index(self, db_id: str, relation_field: str, db_filter=None):
+        relation_filter = {
+            'property': relation_field,
+            'relation': {
+                'is_not_empty': True
             }
+        }
 
-            if 'taskTag' in database:
-                project['taskTag'] = database['taskTag']
-
-            if 'complete' in database:
-                project['complete'] = database['complete']
-
-            for epic in notion_database['results']:
-                name = "Title"
-                if "pageNameField" in database:
-                    name = database["pageNameField"]
-
-                sub_project = {
-                    'epic_id': epic['id'],
-                    'name': epic['properties'][name]['title'][0]['plain_text'].replace(
-                        ' |', ':'
-                    ),
-                    'color': database['colors']['sub'],
-                    'comment': self.create_properties(
-                        fields=database['fields']['epic'],
-                        properties=epic['properties']
-                    ),
-                    'stories': []
-                }
+        if db_filter is not None:
+            relation_filter = {
+                "and": [
+                    relation_filter,
+                    db_filter
+                ]
+            }
+
+        index = collections.defaultdict(list)
+        for results in self.iter_database(db_id=db_id, db_filter=relation_filter):
+            for page in results:
+                for relation in page['properties'][relation_field]['relation']:
+                    index[relation['id']].append(page)
+
+        return index
+
+    def get_sub_projects(self, database: dict, notion_epics: list):
+        # Each level of the tree is fanned out over the pool only once the
+        # previous level is complete, so workers never wait on each other.
+        epics = self.map(
+            functools.partial(self.get_epic, database),
+            notion_epics
+        )
+
+        stories = self.map(
+            functools.partial(self.get_story, database),
+            [story for _, notion_stories in epics for story in notion_stories]
+        )
+
+        sub_tasks = self.map(
+            functools.partial(self.get_sub_task, database),
+            [sub_task for _, notion_tasks in stories for sub_task in notion_tasks]
+        )
+
+        sub_projects = []
+        stories = iter(stories)
+        sub_tasks = iter(sub_tasks)
+        for sub_project, notion_stories in epics:
+            for _ in notion_stories:
+                task, notion_tasks = next(stories)
+                task['sub_tasks'] = [next(sub_tasks) for _ in notion_tasks]
+                sub_project['stories'].append(task)
+
+            sub_projects.append(sub_project)
+
+        return sub_projects
+
+    def get_epic(self, database: dict, epic: dict):
+        name = self.get_page_name_field(database)
+
+        sub_project = {
+            'epic_id': epic['id'],
+            'name': epic['properties'][name]['title'][0]['plain_text'].replace(
+                ' |', ':'
+            ),
+            'color': database['colors']['sub'],
+            'comment': self.create_properties(
+                fields=database['fields']['epic'],
+                properties=epic['properties']
+            ),
+            'stories': []
+        }
 
-                print(f"Reviewing Epic {sub_project['name']}")
+        print(f"Reviewing Epic {sub_project['name']}")
 
-                parent_field = "Parent"
-                if "parentField" in database:
-                    parent_field = database["parentField"]
+        relation_indexes = self.relation_indexes.get(self.get_database_key(database))
+        if relation_indexes is not None:
+            notion_stories = relation_indexes['stories'][epic['id']]
+        else:
+            notion_stories = self.get_notion_children(
+                db_id=self.get_child_database_id(database),
+                parent_id=epic['id'],
+                parent_field=self.get_parent_field(database),
+                sub_filter=self.get_sub_filter(database),
+                override_filter=self.get_override_filter(database)
+            )['results']
+
+        return sub_project, notion_stories
+
+    def get_story(self, database: dict, story: dict):
+        story_name = self.get_story_name_field(database)
+
+        # The description is rendered on first use, by the Todoist writer.
+        task = LazyDict({
+            'story_id': story['id'],
+            'name': story['properties'][story_name]['title'][0]['plain_text'],
+            'description': Lazy(functools.partial(
+                self.get_description,
+                fields=database['fields']['story'],
+                page=story
+            )),
+            'end_date': '',
+            'status': '',
+            'sub_tasks': [],
+            'url': story['url']
+        })
+
+        print(f"Reviewing Story {task['name']}")
+
+        if 'Status' in story['properties']:
+            task['status'] = story['properties']['Status']['status']['name']
 
-                sub_filter = None
-                if "subFilter" in database:
-                    sub_filter = database["subFilter"]
+        if (
+                'skipCompleteComments' in database and
+                database['skipCompleteComments'] and
+                'complete' in database and
+                task['status'] in database['complete']
+        ):
+            task['comments'] = []
+        else:
+            task['comments'] = self.get_comments(story['id'])
+
+        task['start_date'] = ''
+        if (
+                'Start Date' in story['properties']
+                and story['properties']['Start Date']['date']
+        ):
+            task['start_date'] = \
+                story['properties']['Start Date']['date']['start']
+
+        relation_indexes = self.relation_indexes.get(self.get_database_key(database))
+        if relation_indexes is not None:
+            notion_tasks = relation_indexes['tasks'][story['id']]
+        else:
+            notion_tasks = self.get_notion_children(
+                db_id=self.get_child_database_id(database),
+                parent_id=story['id'],
+                parent_field=self.get_task_parent_field(database)
+            )['results']
+
+        return task, notion_tasks
+
+    def get_sub_task(self, database: dict, sub_task: dict):
+        story_name = self.get_story_name_field(database)
+
+        status = ''
+        if 'Status' in sub_task['properties']:
+            status = sub_task['properties']['Status']['status']['name']
+
+        # Sub-task comments are not written to Todoist, so they are only
+        # fetched if something asks for them.
+        return LazyDict({
+            'task_id': sub_task['id'],
+            'comments': Lazy(functools.partial(self.get_comments, sub_task['id'])),
+            'name': sub_task['properties'][story_name]['title'][0][
+                'plain_text'],
+            'description': Lazy(functools.partial(
+                self.get_description,
+                fields=database['fields']['task'],
+                page=sub_task
+            )),
+            'status': status,
+            'url': sub_task['url'],
+        })
+
+    def get_description(self, fields: list, page: dict):
+        return self.create_properties(
+            fields=fields,
+            properties=page['properties'],
+            url=page['url']
+        ) + "\n" + self.get_field(field=page['properties']['Summary'])
+
+    def get_comments(self, page_id: str):
+        # The ID tells comments with the same text apart.
+        return [
+            {'id': comment['id'], 'content': self.rich_text_field(comment)}
+            for comment in self.get_page_comments(page_id)
+        ]
+
+    def stream_map(self, func, items: list):
+        # Keeps up to max_concurrency epics in flight and yields them in order.
+        if self.epic_executor is None or len(items) < 2:
+            yield from map(func, items)
+            return
+
+        pending = collections.deque()
+        for item in items:
+            pending.append(self.epic_executor.submit(func, item))
+
+            if len(pending) >= self.max_concurrency:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def map(self, func, items: list):
+        if self.executor is None or len(items) < 2:
+            return [func(item) for item in items]
+
+        return list(self.executor.map(func, items))
+
+    @staticmethod
+    def get_database_key(database: dict):
+        # Several configured boards can read the same database with their
+        # own filters, so anything built for one is keyed by its name too.
+        # The key is a string so it can be saved in state files.
+        return f"{database['name']}/{database['id']}"
+
+    @staticmethod
+    def get_page_name_field(database: dict):
+        if "pageNameField" in database:
+            return database["pageNameField"]
 
-                override_filter = None
-                if "overrideFilter" in database:
-                    override_filter = database["overrideFilter"]
+        return "Title"
 
-                db_id = database['id']
-                if database['parentDBID']:
-                    db_id = database['parentDBID']
+    def get_story_name_field(self, database: dict):
+        if database['storyName']:
+            return database['storyName']
 
-                notion_stories = self.get_notion_children(
-                    db_id=db_id,
-                    parent_id=epic['id'],
-                    parent_field=parent_field,
-                    sub_filter=sub_filter,
-                    override_filter=override_filter
+        return self.get_page_name_field(database)
+
+    def check_database(self, database: dict):
+        key = self.get_database_key(database)
+        if key in self.checked_databases:
+            return
+
+        if not (self.validate_schema or self.filter_properties):
+            return
+
+        epic_db = database['id']
+        child_db = self.get_child_database_id(database)
+
+        required = {epic_db: set(), child_db: set()}
+        required[epic_db].add(self.get_page_name_field(database))
+        required[child_db].update({
+            self.get_story_name_field(database),
+            self.get_task_parent_field(database),
+            'Summary'
+        })
+        if self.get_override_filter(database) is None:
+            required[child_db].add(self.get_parent_field(database))
+
+        optional = {epic_db: set(), child_db: set()}
+        optional[epic_db].update(database['fields']['epic'])
+        optional[child_db].update(database['fields']['story'], database['fields']['task'])
+
+        for db_id in required:
+            schema = self.get_schema(db_id)
+
+            if self.validate_schema:
+                self.validate_properties(database, db_id, schema, required[db_id], optional[db_id])
+
+            if self.filter_properties:
+                property_ids = {
+                    schema[name]['id'] for name in self.get_property_names(database) if name in schema
+                }
+                self.property_filters[db_id] = sorted(
+                    set(self.property_filters.get(db_id, [])) | property_ids
                 )
 
-                for story in notion_stories['results']:
-                    story_name = name
-                    if database['storyName']:
-                        story_name = database['storyName']
-
-                    task = {
-                        'story_id': story['id'],
-                        'name': story['properties'][story_name]['title'][0]['plain_text'],
-                        'description':
-                            self.create_properties(
-                                fields=database['fields']['story'],
-                                properties=story['properties'],
-                                url=story['url']
-                            ) + "\n" +
-                            self.get_field(field=story['properties']['Summary'])
-                        ,
-                        'end_date': '',
-                        'status': '',
-                        'sub_tasks': [],
-                        'url': story['url']
-                    }
+        self.checked_databases.add(key)
 
-                    print(f"Reviewing Story {task['name']}")
-                    task['comments'] = [self.rich_text_field(comment) for comment in
-                                        self.get_page_comments(story['id'])]
-
-                    if 'Status' in story['properties']:
-                        task['status'] = story['properties']['Status']['status']['name']
-
-                    task['start_date'] = ''
-                    if (
-                            'Start Date' in story['properties']
-                            and story['properties']['Start Date']['date']
-                    ):
-                        task['start_date'] = \
-                            story['properties']['Start Date']['date']['start']
-
-                    parent_field = "Parent"
-                    if database['taskParent']:
-                        parent_field = database['taskParent']
-                    notion_tasks = self.get_notion_children(
-                        db_id=db_id,
-                        parent_id=story['id'],
-                        parent_field=parent_field
-                    )
+    @staticmethod
+    def validate_properties(database: dict, db_id: str, schema: dict, required: set, optional: set):
+        missing = required - set(schema)
+        if missing:
+            raise ValueError(
+                f"{database['name']}: database {db_id} has no "
+                f"{', '.join(sorted(missing))} property; it has {', '.join(sorted(schema))}"
+            )
 
-                    for sub_task in notion_tasks['results']:
-                        status = ''
-
-                        if 'Status' in sub_task['properties']:
-                            status = sub_task['properties']['Status']['status']['name']
-
-                        task['sub_tasks'].append(
-                            {
-                                'task_id': sub_task['id'],
-                                'comments':
-                                    [self.rich_text_field(comment) for comment in
-                                     self.get_page_comments(sub_task['id'])],
-                                'name': sub_task['properties'][story_name]['title'][0][
-                                    'plain_text'],
-                                'description':
-                                    self.create_properties(
-                                        fields=database['fields']['task'],
-                                        properties=sub_task['properties'],
-                                        url=sub_task['url']
-                                    ) + "\n" +
-                                    self.get_field(
-                                        field=sub_task['properties']['Summary']
-                                    ),
-                                'status': status,
-                                'url': sub_task['url'],
-                            }
-                        )
-
-                    sub_project['stories'].append(task)
+        unknown = optional - set(schema)
+        if unknown:
+            print(f"{database['name']}: fields {', '.join(sorted(unknown))} are not in database {db_id}")
+
+    def get_schema(self, db_id: str):
+        if db_id not in self.schemas:
+            self.schemas[db_id] = self.notion_request(
+                endpoint='databases/' + db_id,
+                request_type='get',
+                options={}
+            )['properties']
+
+        return self.schemas[db_id]
+
+    def get_property_names(self, database: dict):
+        names = {
+            self.get_page_name_field(database),
+            self.get_story_name_field(database),
+            self.get_parent_field(database),
+            self.get_task_parent_field(database),
+            'Status',
+            'Start Date',
+            'Summary'
+        }
 
-                project['sub_projects'].append(sub_project)
+        for fields in database['fields'].values():
+            names.update(fields)
 
-            projects.append(project)
+        return frozenset(names)
 
-        return projects
+    @staticmethod
+    def get_parent_field(database: dict):
+        if "parentField" in database:
+            return database["parentField"]
+
+        return "Parent"
+
+    @staticmethod
+    def get_task_parent_field(database: dict):
+        if database['taskParent']:
+            return database['taskParent']
+
+        return "Parent"
+
+    @staticmethod
+    def get_sub_filter(database: dict):
+        if "subFilter" in database:
+            return database["subFilter"]
+
+        return None
+
+    @staticmethod
+    def get_override_filter(database: dict):
+        if "overrideFilter" in database:
+            return database["overrideFilter"]
+
+        return None
+
+    @staticmethod
+    def get_child_database_id(database: dict):
+        if database['parentDBID']:
+            return database['parentDBID']
+
+        return database['id']
 
     def get_notion_database(self, db_id: str, db_filter: dict):
+        return {
+            'results': [
+                result
+                for results in self.iter_database(db_id=db_id, db_filter=db_filter)
+                for result in results
+            ]
+        }
+
+    def iter_database(self, db_id: str, db_filter=None, page_size=None):
         endpoint = 'databases/' + db_id + '/query'
 
-        options = {
-            'data': json.dumps({'filter': db_filter})
-        }
+        query = {'page_size': page_size or self.page_size}
+        if db_filter is not None:
+            query['filter'] = db_filter
+
+        options = {}
+        if db_id in self.property_filters:
+            options['params'] = {'filter_properties': self.property_filters[db_id]}
+
+        while True:
+            response = self.notion_request(
+                endpoint=endpoint,
+                request_type='post',
+                options=dict(options, data=dumpJson(query))
+            )
 
-        return self.notion_request(endpoint=endpoint, request_type='post', options=options)
+            if db_id in self.projections:
+                yield [
+                    NotionPage.from_result(result, self.projections[db_id])
+                    for result in response['results']
+                ]
+            else:
+                yield response['results']
+
+            if not response.get('has_more'):
+                return
+
+            query['start_cursor'] = response['next_cursor']
 
     def get_notion_children(
             self,
@@ -181,7 +754,6 @@ class Notion:
             override_filter=None
 
     ):
-        endpoint = 'databases/' + db_id + '/query'
         children_filter = {
             'property': parent_field,
             'relation': {
@@ -200,24 +772,82 @@ class Notion:
         if override_filter is not None:
             children_filter = override_filter
 
+        return self.get_notion_database(db_id=db_id, db_filter=children_filter)
+
+    def get_page(self, page_id: str):
+        return self.notion_request(
+            endpoint='pages/' + page_id,
+            request_type='get',
+            options={}
+        )
+
+    def get_page_comments(self, story_id: str):
+        return [
+            comment
+            for comments in self.iter_page_comments(story_id)
+            for comment in comments
+        ]
+
+    def iter_page_comments(self, block_id: str, page_size=None):
         options = {
-            'data': json.dumps(
-                {
-                    'filter': children_filter
-                }
-            )
+            'block_id': block_id,
+            'page_size': page_size or self.page_size
         }
 
-        return self.notion_request(endpoint=endpoint, request_type='post', options=options)
+        while True:
+            response = self.notion_request(
+                endpoint='comments',
+                request_type='get',
+                options=options
+            )
 
-    def get_page_comments(self, story_id: str):
-        return self.notion_request(
-            endpoint='comments',
-            request_type='get',
-            options={'block_id': story_id}
-        )['results']
+            yield response['results']
+
+            if not response.get('has_more'):
+                return
+
+            options = dict(options, start_cursor=response['next_cursor'])
+
+    @staticmethod
+    def create_cache(config: dict):
+        path = 'notion_cache.sqlite'
+        if 'cacheFile' in config:
+            path = config['cacheFile']
+
+        ttl = 3600
+        if 'cacheTtl' in config:
+            ttl = config['cacheTtl']
+
+        max_size = 50 * 1024 * 1024
+        if 'cacheMaxSize' in config:
+            max_size = config['cacheMaxSize']
+
+        return ResponseCache(
+            path=os.path.join(sys.path[0], path),
+            ttl=ttl,
+            max_size=max_size
+        )
 
     def notion_request(self, endpoint: str, request_type: str, options: dict):
+        name = f"{request_type.upper()} {metrics.get_endpoint(endpoint)}"
+
+        with metrics.timer('notion', name):
+            if self.cache is None:
+                return self.send_request(endpoint, request_type, options)
+
+            key = ResponseCache.get_key(self.url, endpoint, request_type, options)
+            response = self.cache.get(key)
+
+            if response is None:
+                metrics.increment('cache', 'miss')
+                response = self.send_request(endpoint, request_type, options)
+                self.cache.set(key, response)
+            else:
+                metrics.increment('cache', 'hit')
+
+            return response
+
+    def send_request(self, endpoint: str, request_type: str, options: dict):
         url = self.url + endpoint
 
         headers = {
@@ -233,156 +863,40 @@ class Notion:
             options=options
         )
 
-    @staticmethod
-    def make_request(request_type: str, url: str, headers: dict, options: dict):
-        import requests
-
+    def make_request(self, request_type: str, url: str, headers: dict, options: dict):
         if request_type == 'post':
-            response = requests.post(url, headers=headers, data=options['data'])
-            return response.json()
+            response = self.session.post(
+                url,
+                headers=headers,
+                data=options['data'],
+                params=options.get('params')
+            )
+            response.raise_for_status()
+            return loadJson(response.content)
         elif request_type == 'get':
-            response = requests.get(url, params=options, headers=headers)
-            return response.json()
+            response = self.session.get(url, params=options, headers=headers)
+            response.raise_for_status()
+            return loadJson(response.content)
 
         return {}
 
+    @metrics.timed('transform', 'create_properties')
     def create_properties(self, fields, properties, url=False):
-        content = ''
-
-        if url:
-            notion_url = url.replace('https', 'notion')
-            content = f"**Ticket:** [Open in Notion]({notion_url})\n"
-
-        for field in fields:
-            if field in properties:
-                value = self.get_field(properties[field])
-                content += (
-                    f"**{field}:** {value}\n"
-                )
-
-        if content and url:
-            content += " \n--- "
-        elif content:
-            content = f'{content} \n --- '
-
-        return content
-
-    def get_field(self, field):
-        if type(field) is list and field:
-            field = field[0]
-        elif type(field) is list:
-            return ''
-
-        if field['type'] == 'rich_text':
-            return self.rich_text_field(field)
-
-        elif field['type'] == 'select':
-            return self.select_field(field)
-
-        elif field['type'] == 'status':
-            return self.select_field(field, 'status')
-
-        elif field['type'] == 'formula':
-            return self.formula_field(field)
-
-        elif field['type'] == 'rollup':
-            return self.rollup_field(field)
-
-        elif field['type'] == 'date':
-            return self.date_field(field)
-
-        elif field['type'] == 'unique_id':
-            return f"{field['unique_id']['prefix']}-{field['unique_id']['number']}"
-
-        elif field['type'] == 'multi_select':
-            return functools.reduce(
-                lambda carry, cur: f"`{cur['name']}`" if carry == '' else f"{carry}, `{cur['name']}`",
-                field['multi_select'],
-                ''
-            )
-
-        elif field['type'] == 'people':
-            return functools.reduce(
-                lambda carry, cur: f"`{cur['name']}`" if carry == '' else f"{carry}, `{cur['name']}`",
-                field['people'],
-                ''
-            )
-
-        else:
-            return field[field['type']]
+        return self.get_renderer(fields).render(properties, url)
 
-    @staticmethod
-    def rich_text_field(field):
-        content = ''
-        markdown = {
-            'bold': '**',
-            'italic': '__',
-            'code': '`'
-        }
-
-        for item in field['rich_text']:
-            if item['type'] == 'mention':
-                mention = item['mention']
-
-                if mention['type'] == 'page':
-                    id = f'{mention["page"]["id"]}'.replace('-', '')
-                    text = (
-                        f'[Open in Notion](notion://www.notion.so/{id})'
-                        f' | [Open in Browser](https://www.notion.so/{id})'
-                    )
+    def get_renderer(self, fields):
+        key = tuple(fields)
+        if key not in self.renderers:
+            self.renderers[key] = PropertyRenderer(fields)
 
-                else:
-                    text = mention[mention['type']]['name']
-            else:
-                text = item['text']['content']
-
-            if 'annotations' in item:
-                formatting = item['annotations']
-
-                for option in formatting:
-                    if option in markdown and formatting[option]:
-                        text = f'{markdown[option]}{text}{markdown[option]}'
-
-            href = item['href']
-            if href:
-                text = f'[{text}]({href})'
-
-            if content:
-                content += text
-            else:
-                content = text
-
-        return content
-
-    @staticmethod
-    def select_field(field, type='select'):
-        if field[type] is None:
-            return '(empty)'
-
-        return field[type]['name']
-
-    @staticmethod
-    def formula_field(field):
-        return field['formula'][field['formula']['type']]
+        return self.renderers[key]
 
     @staticmethod
-    def rollup_field(field):
-        return field['rollup'][field['rollup']['type']]
+    @metrics.timed('transform', 'get_field')
+    def get_field(field):
+        return render_field(field)
 
     @staticmethod
-    def date_field(field):
-        if (
-                'start' in field['date'] and
-                'end' in field['date'] and
-                field['date']['start'] and
-                field['date']['end']
-        ):
-            return field['date']['start'] + ' → ' + field['date']['end']
-
-        elif 'start' in field['date'] and field['date']['start']:
-            return field['date']['start']
-
-        elif 'end' in field['date'] and field['date']['end']:
-            return field['date']['end']
-
-        return ''
+    @metrics.timed('transform', 'rich_text_field')
+    def rich_text_field(field):
+        return render_rich_text(field)
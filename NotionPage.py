@@ -0,0 +1,35 @@
+class NotionPage:
+    # A query result trimmed to the properties the sync reads. Pages are
+    # still read with page['properties'][...], like the raw Notion objects.
+    __slots__ = ('id', 'url', 'last_edited_time', 'properties')
+
+    def __init__(self, page_id: str, url: str, last_edited_time: str, properties: dict):
+        self.id = page_id
+        self.url = url
+        self.last_edited_time = last_edited_time
+        self.properties = properties
+
+    @classmethod
+    def from_result(cls, result: dict, property_names: frozenset):
+        properties = result['properties']
+
+        return cls(
+            page_id=result['id'],
+            url=result['url'],
+            last_edited_time=result['last_edited_time'],
+            properties={
+                name: properties[name] for name in property_names if name in properties
+            }
+        )
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key: str):
+        return key in self.__slots__
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
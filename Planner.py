@@ -0,0 +1,33 @@
+import collections
+import math
+
+from TodoistWriter import PlanWriter
+
+
+class Planner:
+
+    def __init__(self, todo):
+        self.todo = todo
+
+    def plan(self, projects: list):
+        writer = self.todo.writer
+        self.todo.writer = PlanWriter()
+
+        try:
+            for project in projects:
+                self.todo.write_project(project)
+
+            operations = self.todo.writer.commands
+        finally:
+            self.todo.writer = writer
+
+        counts = collections.Counter(operation['type'] for operation in operations)
+
+        return {
+            'operations': operations,
+            'counts': dict(counts),
+            'estimatedCalls': {
+                'rest': len(operations),
+                'sync': math.ceil(len(operations) / self.todo.batch_size)
+            }
+        }
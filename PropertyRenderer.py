@@ -0,0 +1,138 @@
+MARKDOWN = (
+    ('bold', '**'),
+    ('italic', '__'),
+    ('code', '`')
+)
+
+
+def render_rich_text(field):
+    parts = []
+
+    for item in field['rich_text']:
+        if item['type'] == 'mention':
+            mention = item['mention']
+
+            if mention['type'] == 'page':
+                page_id = mention['page']['id'].replace('-', '')
+                text = (
+                    f'[Open in Notion](notion://www.notion.so/{page_id})'
+                    f' | [Open in Browser](https://www.notion.so/{page_id})'
+                )
+
+            else:
+                text = mention[mention['type']]['name']
+        else:
+            text = item['text']['content']
+
+        if 'annotations' in item:
+            formatting = item['annotations']
+
+            for option, mark in MARKDOWN:
+                if formatting.get(option):
+                    text = f'{mark}{text}{mark}'
+
+        href = item['href']
+        if href:
+            text = f'[{text}]({href})'
+
+        parts.append(text)
+
+    return ''.join(parts)
+
+
+def render_select(field):
+    if field['select'] is None:
+        return '(empty)'
+
+    return field['select']['name']
+
+
+def render_status(field):
+    if field['status'] is None:
+        return '(empty)'
+
+    return field['status']['name']
+
+
+def render_formula(field):
+    return field['formula'][field['formula']['type']]
+
+
+def render_rollup(field):
+    return field['rollup'][field['rollup']['type']]
+
+
+def render_date(field):
+    start = field['date'].get('start')
+    end = field['date'].get('end')
+
+    if start and end:
+        return start + ' → ' + end
+
+    return start or end or ''
+
+
+def render_unique_id(field):
+    return f"{field['unique_id']['prefix']}-{field['unique_id']['number']}"
+
+
+def render_multi_select(field):
+    return ', '.join(f"`{option['name']}`" for option in field['multi_select'])
+
+
+def render_people(field):
+    return ', '.join(f"`{person['name']}`" for person in field['people'])
+
+
+RENDERERS = {
+    'rich_text': render_rich_text,
+    'select': render_select,
+    'status': render_status,
+    'formula': render_formula,
+    'rollup': render_rollup,
+    'date': render_date,
+    'unique_id': render_unique_id,
+    'multi_select': render_multi_select,
+    'people': render_people
+}
+
+
+def render_field(field):
+    if type(field) is list and field:
+        field = field[0]
+    elif type(field) is list:
+        return ''
+
+    renderer = RENDERERS.get(field['type'])
+    if renderer is None:
+        return field[field['type']]
+
+    return renderer(field)
+
+
+class PropertyRenderer:
+    # A description layout compiled once per field list: the labels are
+    # built up front and each value goes straight to its type's renderer.
+
+    def __init__(self, fields: list):
+        self.plan = tuple((field, f"**{field}:** ") for field in fields)
+
+    def render(self, properties: dict, url=False):
+        lines = []
+
+        if url:
+            notion_url = url.replace('https', 'notion')
+            lines.append(f"**Ticket:** [Open in Notion]({notion_url})\n")
+
+        for field, label in self.plan:
+            if field in properties:
+                lines.append(f"{label}{render_field(properties[field])}\n")
+
+        content = ''.join(lines)
+
+        if content and url:
+            content += " \n--- "
+        elif content:
+            content = f'{content} \n --- '
+
+        return content
@@ -0,0 +1,354 @@
+import re
+import uuid
+
+from FingerprintStore import FingerprintStore
+
+NOTION_KEY = re.compile(r'notion://\S*?([0-9a-f]{32})\)')
+
+
+class Reconcile:
+    # Tasks are matched to Notion pages through the page ID in the "Open in
+    # Notion" link of their description. Plans are Sync API style commands
+    # whose temp_ids stand in for objects that do not exist yet.
+
+    def __init__(self, api, state, fingerprints=None):
+        self.api = api
+        self.state = state
+        self.fingerprints = fingerprints
+        self.pending_pages = {}
+        self.pending_comments = {}
+        self.main_project_id = None
+        self.sub_projects = {}
+        self.tasks = {}
+        self.database_key = None
+        self.complete = False
+        self.tag_name = "Notion-Issue"
+        self.statuses = []
+        self.story_keys = set()
+        self.planned_ids = set()
+
+    def load(self, main_project_id: str):
+        self.main_project_id = main_project_id
+
+        self.sub_projects = {
+            project.name: project
+            for project in self.state.children('projects', main_project_id)
+        }
+
+        project_ids = {main_project_id}
+        project_ids.update(project.id for project in self.sub_projects.values())
+
+        self.tasks = self.state.find_notion_pages(project_ids)
+
+    def plan_project(self, project: dict):
+        self.start_project(project)
+
+        operations = []
+        for epic in project['sub_projects']:
+            operations.extend(self.plan_epic(epic))
+
+        operations.extend(self.finish_project())
+
+        return operations
+
+    def start_project(self, project: dict):
+        self.database_key = project['database_key']
+
+        self.complete = False
+        if 'complete' in project:
+            self.complete = project['complete']
+
+        self.tag_name = "Notion-Issue"
+        if 'taskTag' in project:
+            self.tag_name = project['taskTag']
+
+        self.statuses = project['statuses']
+        self.story_keys = set()
+        self.planned_ids = set()
+        self.pending_pages = {}
+        self.pending_comments = {}
+
+    def commit(self):
+        # Called once the planned operations have been written.
+        if self.fingerprints is not None:
+            self.fingerprints.record(self.pending_pages, self.pending_comments)
+
+        self.pending_pages = {}
+        self.pending_comments = {}
+
+    def plan_epic(self, epic: dict):
+        operations = []
+        project_id = self.plan_sub_project(operations, epic)
+        sections = self.plan_sections(operations, project_id, self.statuses)
+        self.planned_ids.add(project_id)
+
+        for story in epic['stories']:
+            self.story_keys.add(self.get_page_key(story['story_id']))
+            self.plan_task(
+                operations=operations,
+                task=story,
+                project_id=project_id,
+                sections=sections,
+                statuses=self.statuses,
+                complete=self.complete,
+                tag_name=self.tag_name
+            )
+
+        return operations
+
+    def finish_project(self):
+        # Stories that left every planned epic are removed once the whole
+        # project has been seen; tasks without a Notion link were added by
+        # hand and are never touched.
+        operations = []
+        for key, task in self.tasks.items():
+            if (
+                    task.project_id in self.planned_ids and
+                    task.parent_id is None and
+                    key not in self.story_keys
+            ):
+                self.add_operation(operations, 'item_delete', {'id': task.id})
+
+        return operations
+
+    def plan_sub_project(self, operations: list, epic: dict):
+        if epic['name'] in self.sub_projects:
+            return self.sub_projects[epic['name']].id
+
+        project_id = self.add_operation(operations, 'project_add', {
+            'name': epic['name'],
+            'parent_id': self.main_project_id,
+            'color': epic['color']
+        }, temp_id=True)
+
+        if epic['comment']:
+            self.add_operation(operations, 'note_add', {
+                'project_id': project_id,
+                'content': epic['comment']
+            })
+
+        return project_id
+
+    def plan_sections(self, operations: list, project_id: str, statuses: list):
+        return self.state.plan_sections(operations, project_id, statuses)
+
+    def plan_task(
+            self,
+            operations: list,
+            task: dict,
+            project_id: str,
+            sections: dict,
+            statuses: list,
+            complete=False,
+            tag_name="Notion-Issue"
+    ):
+        section = statuses[0]
+        if task['status']:
+            section = task['status']
+
+        due = task['start_date']
+        if complete and task['status'] in complete:
+            due = ''
+
+        key = self.get_page_key(task['story_id'])
+        created = key not in self.tasks
+
+        # A story completed in Todoist is left as the user left it.
+        if not created and self.tasks[key].get('checked'):
+            return
+
+        store_key = FingerprintStore.get_page_key(self.database_key, key)
+
+        fingerprint = None
+        if self.fingerprints is not None:
+            fingerprint = FingerprintStore.get_hash([
+                FingerprintStore.task_fingerprint(task),
+                project_id,
+                sections[section],
+                tag_name,
+                complete
+            ])
+            self.pending_pages[store_key] = fingerprint
+
+        comments = list(task['comments'])
+        if 'comment' in task and task['comment']:
+            comments.insert(0, {'id': None, 'content': task['comment']})
+
+        if self.fingerprints is not None:
+            self.pending_comments[store_key] = comments
+
+        # A task written from exactly this content before, whose open
+        # sub-tasks all still exist, only needs its new comments.
+        if (
+                not created and
+                fingerprint is not None and
+                self.fingerprints.unchanged(store_key, fingerprint) and
+                self.fingerprints.has_comments(store_key) and
+                all(
+                    self.get_page_key(sub_task['task_id']) in self.tasks or
+                    sub_task['status'] == 'Complete'
+                    for sub_task in task['sub_tasks']
+                )
+        ):
+            for comment in self.fingerprints.new_comments(store_key, comments):
+                self.add_operation(operations, 'note_add', {
+                    'item_id': self.tasks[key].id,
+                    'content': comment['content']
+                })
+
+            return
+
+        if created:
+            args = {
+                'content': task['name'],
+                'description': task['description'],
+                'labels': [tag_name],
+                'project_id': project_id,
+                'section_id': sections[section]
+            }
+
+            if due:
+                args['due'] = {'string': due}
+
+            task_id = self.add_operation(operations, 'item_add', args, temp_id=True)
+        else:
+            item = self.tasks[key]
+            task_id = item.id
+
+            self.plan_task_update(operations, item, task, tag_name, due)
+
+            if item.section_id != sections[section]:
+                self.add_operation(operations, 'item_move', {
+                    'id': task_id,
+                    'section_id': sections[section]
+                })
+
+            if self.fingerprints is not None and self.fingerprints.has_comments(store_key):
+                comments = self.fingerprints.new_comments(store_key, comments)
+            elif comments:
+                existing_comments = {
+                    comment.content for comment in self.api.get_comments(task_id=task_id)
+                }
+                comments = [
+                    comment for comment in comments if comment['content'] not in existing_comments
+                ]
+
+        for comment in comments:
+            self.add_operation(operations, 'note_add', {
+                'item_id': task_id,
+                'content': comment['content']
+            })
+
+        sub_task_keys = set()
+        for sub_task in task['sub_tasks']:
+            sub_task_keys.add(self.get_page_key(sub_task['task_id']))
+            self.plan_sub_task(operations, sub_task, task_id, created, tag_name)
+
+        if not created:
+            for key, item in self.tasks.items():
+                if item.parent_id == task_id and key not in sub_task_keys:
+                    self.add_operation(operations, 'item_delete', {'id': item.id})
+
+    def plan_sub_task(
+            self,
+            operations: list,
+            sub_task: dict,
+            parent_id: str,
+            parent_created: bool,
+            tag_name="Notion-Issue"
+    ):
+        key = self.get_page_key(sub_task['task_id'])
+        closed = sub_task['status'] == 'Complete'
+
+        if key in self.tasks:
+            item = self.tasks[key]
+
+            # Closed here or by hand in Todoist; either way it stays closed.
+            if item.get('checked'):
+                return
+
+            self.plan_task_update(operations, item, sub_task, tag_name)
+
+            if item.parent_id != parent_id:
+                self.add_operation(operations, 'item_move', {
+                    'id': item.id,
+                    'parent_id': parent_id
+                })
+
+            if closed:
+                self.add_operation(operations, 'item_close', {'id': item.id})
+
+        # A full Sync API read leaves out completed tasks, so a closed
+        # sub-task we cannot see under an existing story is already done.
+        elif not closed or parent_created:
+            sub_task_id = self.add_operation(operations, 'item_add', {
+                'content': sub_task['name'],
+                'description': sub_task['description'],
+                'labels': [tag_name],
+                'parent_id': parent_id
+            }, temp_id=True)
+
+            if 'comment' in sub_task:
+                self.add_operation(operations, 'note_add', {
+                    'item_id': sub_task_id,
+                    'content': sub_task['comment']
+                })
+
+            if closed:
+                self.add_operation(operations, 'item_close', {'id': sub_task_id})
+
+    def plan_task_update(self, operations: list, item, task: dict, tag_name: str, due=None):
+        args = {}
+
+        if item.content != task['name']:
+            args['content'] = task['name']
+
+        if item.description != task['description']:
+            args['description'] = task['description']
+
+        if tag_name not in item.labels:
+            args['labels'] = item.labels + [tag_name]
+
+        if due is not None:
+            current = ''
+            if item.due:
+                current = item.due.date
+
+            # Timed dates come back as YYYY-MM-DDTHH:MM:SS; only the day is
+            # compared.
+            if current[:10] != due[:10]:
+                args['due'] = {'string': due} if due else None
+
+        if args:
+            args['id'] = item.id
+            self.add_operation(operations, 'item_update', args)
+
+    @staticmethod
+    def add_operation(operations: list, operation_type: str, args: dict, temp_id=False):
+        operation = {
+            'type': operation_type,
+            'uuid': str(uuid.uuid4()),
+            'args': args
+        }
+
+        if temp_id:
+            operation['temp_id'] = str(uuid.uuid4())
+
+        operations.append(operation)
+
+        if temp_id:
+            return operation['temp_id']
+
+        return None
+
+    @staticmethod
+    def get_task_key(description):
+        match = NOTION_KEY.search(description or '')
+        if match:
+            return match.group(1)
+
+        return None
+
+    @staticmethod
+    def get_page_key(page_id: str):
+        return page_id.replace('-', '')
@@ -0,0 +1,65 @@
+import argparse
+import collections
+import json
+import time
+
+from FakeServer import FakeBoard
+from PropertyRenderer import PropertyRenderer, render_field
+
+
+def run(args):
+    board = FakeBoard(epics=args.epics, stories=args.stories, sub_tasks=args.sub_tasks, comments=0)
+    database = board.database_config()
+    pages = board.databases[board.child_db]
+
+    for page in pages:
+        page['properties']['Summary']['rich_text'] *= args.summary_blocks
+
+    fields = database['fields']['story'] + ['Summary']
+    renderer = PropertyRenderer(fields)
+
+    started = time.perf_counter()
+    for _ in range(args.runs):
+        for page in pages:
+            renderer.render(page['properties'], page['url'])
+    elapsed = time.perf_counter() - started
+
+    by_type = collections.Counter()
+    for _ in range(args.runs):
+        for page in pages:
+            for field in fields:
+                value = page['properties'][field]
+
+                started = time.perf_counter()
+                render_field(value)
+                by_type[value['type']] += time.perf_counter() - started
+
+    renders = args.runs * len(pages)
+
+    return {
+        'pages': len(pages),
+        'runs': args.runs,
+        'microsecondsPerPage': round(elapsed / renders * 1e6, 2),
+        'microsecondsPerField': {
+            field_type: round(seconds / renders * 1e6, 2)
+            for field_type, seconds in by_type.most_common()
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time description rendering on synthetic Notion pages.'
+    )
+    parser.add_argument('--epics', type=int, default=20)
+    parser.add_argument('--stories', type=int, default=25)
+    parser.add_argument('--sub-tasks', type=int, default=3)
+    parser.add_argument('--summary-blocks', type=int, default=4, help='Rich text blocks in every Summary')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args), indent=4))
+
+
+if __name__ == '__main__':
+    main()
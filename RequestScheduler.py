@@ -0,0 +1,151 @@
+import collections
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Tokens are reserved up front and may go negative, so concurrent
+        # callers queue up behind each other instead of all waking at once.
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+
+            wait = 0
+            if self.tokens < 0:
+                wait = -self.tokens / self.rate
+
+        if wait:
+            time.sleep(wait)
+
+        return wait
+
+    def pause(self, seconds: float):
+        # Refilled first, so the time before the pause is not credited to
+        # the next caller.
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RequestScheduler:
+    RETRY_STATUSES = (500, 502, 503, 504)
+
+    def __init__(
+            self,
+            config: dict,
+            idempotent_methods=('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'),
+            rate: float = 3,
+            burst: float = None
+    ):
+        if 'rateLimit' in config:
+            rate = config['rateLimit']
+
+        # A configured rate without a burst gets its old default again.
+        if 'burst' in config:
+            burst = config['burst']
+        elif 'rateLimit' in config or burst is None:
+            burst = rate
+
+        self.max_retries = 5
+        if 'maxRetries' in config:
+            self.max_retries = config['maxRetries']
+
+        self.backoff = 1
+        if 'backoff' in config:
+            self.backoff = config['backoff']
+
+        self.max_backoff = 60
+        self.bucket = TokenBucket(rate=rate, capacity=burst)
+        self.idempotent_methods = idempotent_methods
+        self.counters = collections.Counter()
+        self.lock = threading.Lock()
+
+    def request(self, send, method: str):
+        idempotent = method.upper() in self.idempotent_methods
+        attempt = 0
+
+        while True:
+            self.count('throttle_wait', self.bucket.acquire())
+            self.count('requests')
+
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout):
+                if not idempotent or attempt >= self.max_retries:
+                    self.count('failures')
+                    raise
+
+                delay = self.get_backoff(attempt)
+            else:
+                if response.status_code == 429:
+                    self.count('throttled')
+                elif response.status_code in self.RETRY_STATUSES and idempotent:
+                    self.count('server_errors')
+                else:
+                    return response
+
+                if attempt >= self.max_retries:
+                    self.count('failures')
+                    return response
+
+                delay = self.get_retry_after(response)
+                if delay is None:
+                    delay = self.get_backoff(attempt)
+
+                if response.status_code == 429:
+                    # Hold back every caller sharing this bucket, not just
+                    # the one that was throttled.
+                    self.bucket.pause(delay)
+
+            attempt += 1
+            self.count('retries')
+            self.count('backoff_wait', delay)
+            time.sleep(delay)
+
+    def get_backoff(self, attempt: int):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    @staticmethod
+    def get_retry_after(response):
+        retry_after = response.headers.get('Retry-After')
+        if not retry_after:
+            return None
+
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def count(self, name: str, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from util import dumpJson, loadJson
+
+
+class ResponseCache:
+
+    def __init__(self, path: str, ttl: float = 3600, max_size: int = 50 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)'
+        )
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)'
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def get_key(*parts):
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value, created FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            if now - row[1] > self.ttl:
+                self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.connection.commit()
+                return None
+
+            self.connection.execute(
+                'UPDATE responses SET accessed = ? WHERE key = ?', (now, key)
+            )
+            self.connection.commit()
+
+        return loadJson(zlib.decompress(row[0]))
+
+    def set(self, key: str, value):
+        data = zlib.compress(dumpJson(value).encode('utf-8'))
+        now = time.time()
+
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                (key, data, len(data), now, now)
+            )
+            self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        total = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses'
+        ).fetchone()[0]
+
+        if total <= self.max_size:
+            return
+
+        # Drop the least recently used entries until the cache fits again.
+        for key, size in self.connection.execute(
+                'SELECT key, size FROM responses ORDER BY accessed'
+        ).fetchall():
+            self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+
+            if total <= self.max_size:
+                break
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM responses')
+            self.connection.commit()
@@ -0,0 +1,74 @@
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from util import getStateFile, saveStateFile
+
+
+class RunJournal:
+    # A checkpoint file for full syncs. Every epic is recorded, with the ID of
+    # its Todoist project, once its writes have been flushed, and every
+    # board once it has finished. If a run dies, the next one skips what
+    # the journal already holds. A completed run is marked as such.
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.journal = None
+
+    def begin(self):
+        journal = getStateFile(self.name)
+
+        with self.lock:
+            if journal and journal.get('status') == 'running':
+                self.journal = journal
+                print(f"Resuming sync run {journal['run_id']} started at {journal['started']}")
+
+                return True
+
+            self.journal = {
+                'run_id': str(uuid.uuid4()),
+                'status': 'running',
+                'started': datetime.now(timezone.utc).replace(second=0, microsecond=0).isoformat(),
+                'databases': {}
+            }
+            self.save()
+
+        return False
+
+    @property
+    def started(self):
+        return self.journal['started']
+
+    def database_done(self, database_key: str):
+        with self.lock:
+            return self.get_database(database_key)['done']
+
+    def done_epic_ids(self, database_key: str):
+        with self.lock:
+            return set(self.get_database(database_key)['epics'])
+
+    def commit_epic(self, database_key: str, epic_id: str, todoist_ids: dict):
+        with self.lock:
+            self.get_database(database_key)['epics'][epic_id] = todoist_ids
+            self.save()
+
+    def commit_database(self, database_key: str):
+        with self.lock:
+            self.get_database(database_key)['done'] = True
+            self.save()
+
+    def finish(self):
+        with self.lock:
+            self.journal['status'] = 'complete'
+            self.journal['finished'] = datetime.now(timezone.utc).isoformat()
+            self.save()
+
+    def get_database(self, database_key: str):
+        if database_key not in self.journal['databases']:
+            self.journal['databases'][database_key] = {'done': False, 'epics': {}}
+
+        return self.journal['databases'][database_key]
+
+    def save(self):
+        saveStateFile(self.name, self.journal)
@@ -1,90 +1,239 @@
-from typing import Optional
+import copy
+import json
 
 from todoist_api_python.api import TodoistAPI
-from todoist_api_python.models import Project
+from todoist_api_python.endpoints import REST_API
+
+from FingerprintStore import FingerprintStore
+from HttpSession import HttpSession
+from Reconcile import Reconcile
+from TodoistState import TodoistState
+from TodoistWriter import RestWriter, SyncWriter
+from util import loadJson
 
 
 class Todoist:
-    main_project: Project
-    sub_project: Project
+    main_project_id: str
+    sub_project_id: str
     sections: dict
 
-    def __init__(self, config):
+    def __init__(self, config, load_state=True):
         self.secret = config['secret']
-        self.api = TodoistAPI(self.secret)
-        self.projects = self.get_projects()
+        # Todoist allows 450 requests per 15 minutes; the burst is taken out
+        # of the steady rate so a full window stays under the limit.
+        self.session = HttpSession(config, name='todoist', rate=0.45, burst=45)
+
+        if 'restUrl' in config:
+            self.session.url_prefixes[REST_API] = config['restUrl']
+
+        self.api = TodoistAPI(self.secret, session=self.session)
+
+        self.sync_url = 'https://api.todoist.com/sync/v9/'
+        if 'syncUrl' in config:
+            self.sync_url = config['syncUrl']
+
+        snapshot_file = None
+        if 'snapshotFile' in config:
+            snapshot_file = config['snapshotFile']
+
+        self.state = TodoistState(self.sync, snapshot_file=snapshot_file)
+        if load_state:
+            self.state.load()
+
+        self.batch_size = 100
+        if 'batchSize' in config:
+            self.batch_size = config['batchSize']
+
+        self.batch_writes = 'batchWrites' in config and config['batchWrites']
+        self.writer = self.create_writer()
+
+        self.fingerprints = None
+        if 'fingerprintFile' in config:
+            self.fingerprints = FingerprintStore(config['fingerprintFile'])
+
+        self.reconciler = None
+        if 'reconcile' in config and config['reconcile']:
+            self.reconciler = Reconcile(self.api, self.state, self.fingerprints)
+
+    def create_writer(self):
+        if self.batch_writes:
+            return SyncWriter(self.sync_commands, batch_size=self.batch_size, state=self.state)
+
+        return RestWriter(self.api, self.sync_commands, state=self.state)
+
+    def create_job(self):
+        # A job shares the API client, session and state index but has its
+        # own writer, reconciler and current project/section context, so
+        # several databases can be written at the same time.
+        job = copy.copy(self)
+        job.writer = self.create_writer()
+        job.main_project_id = None
+        job.sub_project_id = None
+        job.sections = {}
+
+        if self.reconciler is not None:
+            job.reconciler = Reconcile(self.api, self.state, self.fingerprints)
+
+        return job
+
+    def write_project(self, project: dict):
+        self.start_project(project)
+
+        for epic in project['sub_projects']:
+            self.write_epic(project, epic)
+
+        self.finish_project(project)
+
+    def start_project(self, project: dict):
+        self.set_main_project(project)
+
+        if self.reconciler is not None:
+            self.reconciler.start_project(project)
+
+    def write_epic(self, project: dict, epic: dict):
+        if self.reconciler is not None:
+            operations = self.reconciler.plan_epic(epic)
+            print(f"Applying {len(operations)} changes to {epic['name']}")
+            self.execute(operations)
+            self.flush()
+            self.reconciler.commit()
+            return
+
+        # Epics are rebuilt from scratch, so one that is unchanged since it
+        # was last written, and still exists, is left alone entirely.
+        fingerprint = None
+        epic_key = FingerprintStore.get_page_key(project['database_key'], epic['epic_id'])
+        if self.fingerprints is not None:
+            fingerprint = FingerprintStore.epic_fingerprint(project, epic)
+
+            if (
+                    self.fingerprints.unchanged(epic_key, fingerprint) and
+                    self.state.find('projects', self.main_project_id, epic['name']) is not None
+            ):
+                print(f"{epic['name']} is unchanged")
+                return
+
+        complete = False
+        if 'complete' in project:
+            complete = project['complete']
+
+        task_tag = "Notion-Issue"
+        if 'taskTag' in project:
+            task_tag = project['taskTag']
+
+        self.set_sub_project(epic)
+        self.set_sections(project['statuses'])
 
-    def get_projects(self):
-        import requests
+        for story in epic['stories']:
+            self.create_todoist_task(
+                task=story,
+                statuses=project['statuses'],
+                complete=complete,
+                tag_name=task_tag
+            )
+
+        self.flush()
+
+        if fingerprint is not None:
+            self.fingerprints.record({epic_key: fingerprint}, {})
+
+    def finish_project(self, project: dict):
+        if self.reconciler is not None:
+            operations = self.reconciler.finish_project()
+            print(f"Applying {len(operations)} removals to {project['name']}")
+            self.execute(operations)
 
-        projects = self.api.get_projects()
+        self.flush()
 
-        formatted = {}
-        for project in projects:
-            formatted[project.name] = project
+    def get_epic_project_id(self, epic: dict):
+        project = self.state.find('projects', self.writer.resolve(self.main_project_id), epic['name'])
+        if project is None:
+            return None
 
-        return formatted
+        return project.id
+
+    def save(self):
+        self.state.save()
+
+        if self.fingerprints is not None:
+            self.fingerprints.save()
 
     def set_main_project(self, project: dict):
-        if project['name'] in self.projects:
-            main_project = self.projects[project['name']]
+        existing = self.state.find('projects', None, project['name'])
+        if existing is not None:
+            main_project_id = existing.id
         else:
-            main_project = self.create_todoist_project(project=project)
+            main_project_id = self.create_todoist_project(project=project)
 
-        self.main_project = main_project
+        self.main_project_id = main_project_id
 
-    def set_sub_project(self, project: dict):
-        if (
-                project['name'] in self.projects and
-                self.projects[project['name']].parent_id == self.main_project.id
-        ):
-            self.api.delete_project(
-                project_id=self.projects[project['name']].id
+        if self.reconciler is not None:
+            self.reconciler.load(main_project_id)
+
+    def execute(self, operations: list):
+        for operation in operations:
+            self.writer.add(
+                operation_type=operation['type'],
+                args=operation['args'],
+                temp_id=operation.get('temp_id')
             )
 
-        sub_project = self.create_todoist_project(
-            project=project,
-            parent_id=self.main_project.id
+    def flush(self):
+        self.writer.flush()
+
+    def sync(self, data: dict):
+        response = self.session.post(
+            self.sync_url + 'sync',
+            headers={'Authorization': f"Bearer {self.secret}"},
+            data={
+                key: value if isinstance(value, str) else json.dumps(value)
+                for key, value in data.items()
+            }
         )
+        response.raise_for_status()
+
+        return loadJson(response.content)
+
+    def sync_commands(self, commands: list):
+        return self.sync({'commands': commands})
+
+    def set_sub_project(self, project: dict):
+        existing = self.state.find('projects', self.main_project_id, project['name'])
+        if existing is not None:
+            self.writer.add('project_delete', {'id': existing.id})
 
-        self.sub_project = sub_project
+        self.sub_project_id = self.create_todoist_sub_project(
+            project=project,
+            parent_id=self.main_project_id
+        )
 
     def set_sections(self, statuses):
-        sections = {}
-        for status in statuses:
-            sections[status] = self.api.add_section(
-                name=status,
-                project_id=self.sub_project.id
-            )
+        operations = []
+        self.sections = self.state.plan_sections(operations, self.sub_project_id, statuses)
+        self.execute(operations)
 
-        self.sections = sections
-
-    def create_todoist_project(
-            self,
-            project: dict,
-            parent_id: Optional[str] = None
-    ):
-        if parent_id:
-            print(f"Creating Sub-Project: {project['name']}")
-            todoist_project = self.api.add_project(
-                name=project['name'],
-                parent_id=parent_id,
-                color=project['color'],
-            )
+    def create_todoist_project(self, project: dict):
+        print(f"Creating Project: {project['name']}")
+        return self.writer.add('project_add', {
+            'name': project['name'],
+            'color': project['color']
+        })
 
-            if project['comment']:
-                self.api.add_comment(
-                    project_id=todoist_project.id,
-                    content=project['comment']
-                )
-        else:
-            print(f"Creating Project: {project['name']}")
-            todoist_project = self.api.add_project(
-                name=project['name'],
-                color=project['color']
-            )
+    def create_todoist_sub_project(self, project: dict, parent_id: str):
+        print(f"Creating Sub-Project: {project['name']}")
+        sub_project_id = self.writer.add('project_add', {
+            'name': project['name'],
+            'parent_id': parent_id,
+            'color': project['color'],
+        })
 
-        return todoist_project
+        if project['comment']:
+            self.writer.add('note_add', {
+                'project_id': sub_project_id,
+                'content': project['comment']
+            })
+
+        return sub_project_id
 
     def create_todoist_task(self, task, statuses, complete=False, tag_name="Notion-Issue"):
         print(f"Creating task {task['name']}")
@@ -93,42 +242,40 @@ class Todoist:
         if task['status']:
             section = task['status']
 
-        if complete and task['status'] in complete:
-            item = self.api.add_task(
-                content=task['name'],
-                description=task['description'],
-                labels=[tag_name],
-                section_id=self.sections[section].id,
-                project_id=self.sub_project.id
-            )
-        else:
-            item = self.api.add_task(
-                content=task['name'],
-                description=task['description'],
-                labels=[tag_name],
-                section_id=self.sections[section].id,
-                due_string=task['start_date'],
-                project_id=self.sub_project.id
-            )
+        args = {
+            'content': task['name'],
+            'description': task['description'],
+            'labels': [tag_name],
+            'section_id': self.sections[section],
+            'project_id': self.sub_project_id
+        }
+
+        if not (complete and task['status'] in complete) and task['start_date']:
+            args['due'] = {'string': task['start_date']}
+
+        item_id = self.writer.add('item_add', args)
 
         if 'comment' in task and task['comment']:
-            self.api.add_comment(task_id=item.id, content=task['comment'])
+            self.writer.add('note_add', {'item_id': item_id, 'content': task['comment']})
 
         for comment in task['comments']:
-            self.api.add_comment(task_id=item.id, content=comment)
+            self.writer.add('note_add', {'item_id': item_id, 'content': comment['content']})
 
         if task['sub_tasks']:
             for sub_task in task['sub_tasks']:
                 print(f"Adding subtask {sub_task['name']} to {task['name']}")
-                sub_item = self.api.add_task(
-                    content=sub_task['name'],
-                    description=sub_task['description'],
-                    labels=[tag_name],
-                    parent_id=item.id
-                )
+                sub_item_id = self.writer.add('item_add', {
+                    'content': sub_task['name'],
+                    'description': sub_task['description'],
+                    'labels': [tag_name],
+                    'parent_id': item_id
+                })
 
                 if 'comment' in sub_task:
-                    self.api.add_comment(task_id=sub_item.id, content=sub_task['comment'])
+                    self.writer.add('note_add', {
+                        'item_id': sub_item_id,
+                        'content': sub_task['comment']
+                    })
 
                 if sub_task['status'] == 'Complete':
-                    self.api.close_task(task_id=sub_item.id)
+                    self.writer.add('item_close', {'id': sub_item_id})
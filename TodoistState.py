@@ -0,0 +1,304 @@
+import threading
+
+from Reconcile import Reconcile
+from util import getStateFile, saveStateFile
+
+
+class Record(dict):
+    # Sync API objects are plain dicts; attribute access lets them stand in
+    # for the REST API models the rest of the code was written against.
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class TodoistState:
+    # An in-memory copy of the Todoist account, read in one Sync API call and
+    # kept current by applying every write made through a TodoistWriter.
+    RESOURCE_TYPES = ['projects', 'sections', 'items', 'labels']
+
+    def __init__(self, sync, snapshot_file: str = None):
+        self.sync = sync
+        self.snapshot_file = snapshot_file
+        self.sync_token = '*'
+        self.lock = threading.RLock()
+
+        self.resources = {resource: {} for resource in self.RESOURCE_TYPES}
+        self.names = {resource: {} for resource in self.RESOURCE_TYPES}
+        self.parents = {resource: {} for resource in self.RESOURCE_TYPES}
+        self.sub_items = {}
+        self.notion_ids = {}
+
+    def load(self):
+        if self.snapshot_file and self.sync_token == '*':
+            snapshot = getStateFile(self.snapshot_file)
+            if snapshot:
+                with self.lock:
+                    self.sync_token = snapshot['sync_token']
+                    for resource in self.RESOURCE_TYPES:
+                        for record in snapshot['resources'][resource]:
+                            self.put(resource, record)
+
+        response = self.sync({
+            'sync_token': self.sync_token,
+            'resource_types': self.RESOURCE_TYPES
+        })
+
+        with self.lock:
+            if response.get('full_sync', True):
+                self.clear()
+
+            for resource in self.RESOURCE_TYPES:
+                for record in response.get(resource, []):
+                    # Completed items stay in the index so they are not
+                    # mistaken for ones that were never created.
+                    if record.get('is_deleted') or record.get('is_archived'):
+                        self.remove(resource, str(record['id']))
+                    else:
+                        self.put(resource, record)
+
+            self.sync_token = response.get('sync_token', '*')
+
+        print(
+            f"Loaded Todoist state: {len(self.resources['projects'])} projects, "
+            f"{len(self.resources['sections'])} sections, {len(self.resources['items'])} tasks"
+        )
+
+    def save(self):
+        if not self.snapshot_file:
+            return
+
+        with self.lock:
+            saveStateFile(self.snapshot_file, {
+                'sync_token': self.sync_token,
+                'resources': {
+                    resource: list(records.values())
+                    for resource, records in self.resources.items()
+                }
+            })
+
+    def clear(self):
+        for resource in self.RESOURCE_TYPES:
+            self.resources[resource] = {}
+            self.names[resource] = {}
+            self.parents[resource] = {}
+
+        self.sub_items = {}
+        self.notion_ids = {}
+
+    def get(self, resource: str, object_id: str):
+        return self.resources[resource].get(object_id)
+
+    def find(self, resource: str, parent_id, name: str):
+        with self.lock:
+            object_id = self.names[resource].get((parent_id, name))
+
+        if object_id is None:
+            return None
+
+        return self.get(resource, object_id)
+
+    def find_notion_pages(self, project_ids: set):
+        # Items linked to a Notion page, by page key, in the given projects.
+        with self.lock:
+            return {
+                page_key: self.resources['items'][object_id]
+                for page_key, object_ids in self.notion_ids.items()
+                for object_id in object_ids
+                if self.resources['items'][object_id]['project_id'] in project_ids
+            }
+
+    def children(self, resource: str, parent_id: str):
+        with self.lock:
+            return [
+                self.resources[resource][object_id]
+                for object_id in self.parents[resource].get(parent_id, ())
+            ]
+
+    def put(self, resource: str, record: dict):
+        record = Record(record)
+        record['id'] = str(record['id'])
+
+        if resource == 'projects':
+            record.setdefault('parent_id', None)
+
+        if resource == 'items' and record.get('due'):
+            record['due'] = Record(record['due'])
+
+        if record['id'] in self.resources[resource]:
+            self.unindex(resource, self.resources[resource][record['id']])
+
+        self.resources[resource][record['id']] = record
+        self.names[resource][self.get_name_key(resource, record)] = record['id']
+
+        parent_id = record.get(self.get_parent_field(resource))
+        self.parents[resource].setdefault(parent_id, {})[record['id']] = None
+
+        if resource == 'items':
+            self.sub_items.setdefault(record.get('parent_id'), {})[record['id']] = None
+
+            # Boards that share a database have a copy of the page each.
+            page_key = Reconcile.get_task_key(record.get('description'))
+            if page_key:
+                self.notion_ids.setdefault(page_key, {})[record['id']] = None
+
+        return record
+
+    def remove(self, resource: str, object_id: str):
+        record = self.resources[resource].pop(object_id, None)
+        if record is not None:
+            self.unindex(resource, record)
+
+        return record
+
+    def unindex(self, resource: str, record: dict):
+        name_key = self.get_name_key(resource, record)
+        if self.names[resource].get(name_key) == record['id']:
+            del self.names[resource][name_key]
+
+        parent_id = record.get(self.get_parent_field(resource))
+        self.parents[resource].get(parent_id, {}).pop(record['id'], None)
+
+        if resource == 'items':
+            self.sub_items.get(record.get('parent_id'), {}).pop(record['id'], None)
+
+            page_key = Reconcile.get_task_key(record.get('description'))
+            if page_key in self.notion_ids:
+                self.notion_ids[page_key].pop(record['id'], None)
+                if not self.notion_ids[page_key]:
+                    del self.notion_ids[page_key]
+
+    def apply(self, operation_type: str, args: dict, object_id: str = None):
+        with self.lock:
+            if operation_type == 'project_add':
+                self.put('projects', dict(args, id=object_id))
+
+            elif operation_type == 'project_delete':
+                self.remove_project(args['id'])
+
+            elif operation_type == 'section_add':
+                self.put('sections', dict(args, id=object_id))
+
+            elif operation_type == 'section_reorder':
+                for order in args['sections']:
+                    section = self.get('sections', order['id'])
+                    if section is not None:
+                        self.put('sections', dict(section, section_order=order['section_order']))
+
+            elif operation_type == 'item_add':
+                self.put('items', self.get_item(dict(args, id=object_id)))
+
+            elif operation_type == 'item_update':
+                item = self.get('items', args['id'])
+                if item is not None:
+                    self.put('items', self.get_item(dict(item, **args)))
+
+            elif operation_type == 'item_move':
+                item = self.get('items', args['id'])
+                if item is not None:
+                    item = dict(item, **args)
+                    if 'project_id' in args:
+                        item['section_id'] = None
+                    self.put('items', self.get_item(item))
+
+            elif operation_type == 'item_close':
+                self.close_item(args['id'])
+
+            elif operation_type == 'item_delete':
+                self.remove_item(args['id'])
+
+    def plan_sections(self, operations: list, project_id: str, statuses: list):
+        # Sections follow the order of the statuses. Only missing ones are
+        # created, and existing ones that are out of place are moved back
+        # with a single reorder command.
+        sections = {}
+        reorder = []
+        for order, status in enumerate(statuses, start=1):
+            section = self.find('sections', project_id, status)
+
+            if section is None:
+                sections[status] = Reconcile.add_operation(operations, 'section_add', {
+                    'name': status,
+                    'project_id': project_id,
+                    'section_order': order
+                }, temp_id=True)
+            else:
+                sections[status] = section.id
+                if section.get('section_order') != order:
+                    reorder.append({'id': section.id, 'section_order': order})
+
+        if reorder:
+            Reconcile.add_operation(operations, 'section_reorder', {'sections': reorder})
+
+        return sections
+
+    def remove_project(self, project_id: str):
+        for child in self.children('projects', project_id):
+            self.remove_project(child['id'])
+
+        for resource in ('sections', 'items'):
+            for record in self.children(resource, project_id):
+                self.remove(resource, record['id'])
+
+        self.remove('projects', project_id)
+
+    def close_item(self, item_id: str):
+        # Closing a task completes its sub-tasks too.
+        for child_id in list(self.sub_items.get(item_id, ())):
+            self.close_item(child_id)
+
+        item = self.get('items', item_id)
+        if item is not None:
+            self.put('items', dict(item, checked=True))
+
+    def remove_item(self, item_id: str):
+        for child_id in list(self.sub_items.get(item_id, ())):
+            self.remove_item(child_id)
+
+        self.remove('items', item_id)
+
+    def get_item(self, item: dict):
+        # Sub-tasks live in their parent's project and section, and a section
+        # implies its project.
+        parent = self.get('items', item.get('parent_id'))
+        if parent is not None:
+            item['project_id'] = parent['project_id']
+            item['section_id'] = parent.get('section_id')
+
+        section = self.get('sections', item.get('section_id'))
+        if section is not None:
+            item['project_id'] = section['project_id']
+
+        if 'due' in item:
+            due = item['due']
+            if due and 'string' in due and 'date' not in due:
+                due = {'date': due['string'][:10], 'string': due['string']}
+            item['due'] = due or None
+
+        item.setdefault('description', '')
+        item.setdefault('labels', [])
+        item.setdefault('parent_id', None)
+        item.setdefault('section_id', None)
+        item.setdefault('due', None)
+
+        return item
+
+    @staticmethod
+    def get_parent_field(resource: str):
+        if resource == 'projects':
+            return 'parent_id'
+
+        return 'project_id'
+
+    @staticmethod
+    def get_name_key(resource: str, record: dict):
+        if resource == 'items':
+            return record.get('parent_id') or record.get('project_id'), record.get('content')
+
+        if resource == 'labels':
+            return None, record.get('name')
+
+        return record.get(TodoistState.get_parent_field(resource)), record.get('name')
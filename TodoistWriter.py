@@ -0,0 +1,197 @@
+import json
+import uuid
+
+from Metrics import metrics
+
+
+class TodoistWriter:
+    # Writes are described as Sync API commands. Objects created by a command
+    # are referred to by a temp_id until the real ID is known.
+
+    def __init__(self, state=None):
+        self.ids = {}
+        self.state = state
+
+    def flush(self):
+        pass
+
+    def resolve(self, value):
+        if isinstance(value, str) and value in self.ids:
+            return self.ids[value]
+
+        return value
+
+    def resolve_args(self, args: dict):
+        return {key: self.resolve(value) for key, value in args.items()}
+
+    def record(self, operation_type: str, args: dict, object_id: str = None):
+        if self.state is not None:
+            self.state.apply(operation_type, args, object_id)
+
+    @staticmethod
+    def new_temp_id(operation_type: str, temp_id: str = None):
+        if temp_id is None and operation_type.endswith('_add'):
+            return str(uuid.uuid4())
+
+        return temp_id
+
+
+class RestWriter(TodoistWriter):
+
+    def __init__(self, api, sync_commands, state=None):
+        super().__init__(state)
+        self.api = api
+        self.sync_commands = sync_commands
+
+    def add(self, operation_type: str, args: dict, temp_id: str = None):
+        args = self.resolve_args(args)
+        with metrics.timer('write', operation_type):
+            result = self.execute(operation_type, dict(args))
+
+        metrics.increment('writes', operation_type)
+
+        if self.new_temp_id(operation_type, temp_id) is None:
+            self.record(operation_type, args)
+            return None
+
+        if temp_id is not None:
+            self.ids[temp_id] = result.id
+
+        self.record(operation_type, args, result.id)
+
+        return result.id
+
+    def execute(self, operation_type: str, args: dict):
+        if operation_type in ('item_add', 'item_update') and 'due' in args:
+            due = args.pop('due')
+            args['due_string'] = due['string'] if due else 'no date'
+
+        if operation_type == 'section_add' and 'section_order' in args:
+            args['order'] = args.pop('section_order')
+
+        if operation_type == 'project_add':
+            return self.api.add_project(**args)
+
+        elif operation_type == 'project_delete':
+            return self.api.delete_project(project_id=args['id'])
+
+        elif operation_type == 'section_add':
+            return self.api.add_section(**args)
+
+        elif operation_type == 'note_add' and 'item_id' in args:
+            return self.api.add_comment(task_id=args['item_id'], content=args['content'])
+
+        elif operation_type == 'note_add':
+            return self.api.add_comment(project_id=args['project_id'], content=args['content'])
+
+        elif operation_type == 'item_add':
+            return self.api.add_task(**args)
+
+        elif operation_type == 'item_update':
+            return self.api.update_task(task_id=args.pop('id'), **args)
+
+        elif operation_type in ('item_move', 'section_reorder'):
+            # The REST API cannot move tasks between sections or parents, or
+            # reorder sections.
+            return self.sync_commands([
+                {'type': operation_type, 'uuid': str(uuid.uuid4()), 'args': args}
+            ])
+
+        elif operation_type == 'item_close':
+            return self.api.close_task(task_id=args['id'])
+
+        elif operation_type == 'item_delete':
+            return self.api.delete_task(task_id=args['id'])
+
+        raise ValueError(f"Unknown Todoist operation {operation_type}")
+
+
+class SyncWriter(TodoistWriter):
+
+    def __init__(self, sync_commands, batch_size: int = 100, state=None):
+        super().__init__(state)
+        self.sync_commands = sync_commands
+        self.batch_size = batch_size
+        self.commands = []
+
+    def add(self, operation_type: str, args: dict, temp_id: str = None):
+        command = {
+            'type': operation_type,
+            'uuid': str(uuid.uuid4()),
+            'args': args
+        }
+
+        temp_id = self.new_temp_id(operation_type, temp_id)
+        if temp_id is not None:
+            command['temp_id'] = temp_id
+
+        self.commands.append(command)
+        metrics.increment('writes', operation_type)
+
+        if len(self.commands) >= self.batch_size:
+            self.flush()
+
+        return temp_id
+
+    def flush(self):
+        while self.commands:
+            batch = self.commands[:self.batch_size]
+            self.commands = self.commands[self.batch_size:]
+
+            # temp_ids only resolve inside the request that created them, so
+            # references to earlier batches are swapped for the real IDs.
+            for command in batch:
+                command['args'] = self.resolve_args(command['args'])
+
+            print(f"Sending {len(batch)} commands to Todoist")
+            with metrics.timer('write', 'sync_batch'):
+                response = self.sync_commands(batch)
+            self.ids.update(response['temp_id_mapping'])
+
+            for command in batch:
+                if response['sync_status'].get(command['uuid']) == 'ok':
+                    self.record(
+                        command['type'],
+                        self.resolve_args(command['args']),
+                        self.ids.get(command.get('temp_id'))
+                    )
+
+            errors = {
+                command['type']: response['sync_status'][command['uuid']]
+                for command in batch
+                if response['sync_status'].get(command['uuid']) != 'ok'
+            }
+
+            if errors:
+                raise RuntimeError(f"Todoist rejected commands: {json.dumps(errors)}")
+
+    def release_ids(self):
+        # Forgets the temp ids of objects already created. Queued commands
+        # get the real IDs first; callers must resolve any they still hold.
+        for command in self.commands:
+            command['args'] = self.resolve_args(command['args'])
+
+        self.ids.clear()
+
+
+class PlanWriter(TodoistWriter):
+    # Records commands instead of sending them, for dry runs.
+
+    def __init__(self):
+        super().__init__()
+        self.commands = []
+
+    def add(self, operation_type: str, args: dict, temp_id: str = None):
+        command = {
+            'type': operation_type,
+            'uuid': str(uuid.uuid4()),
+            'args': args
+        }
+
+        temp_id = self.new_temp_id(operation_type, temp_id)
+        if temp_id is not None:
+            command['temp_id'] = temp_id
+
+        self.commands.append(command)
+
+        return temp_id
@@ -0,0 +1,81 @@
+import heapq
+import threading
+import time
+
+
+class Watcher:
+    # Keeps one Main, with its sessions and Todoist state, alive and syncs
+    # each database on its own schedule. Only epics edited since the last
+    # poll are fetched and written. A database with nothing to write is
+    # polled less and less often, up to maxInterval, and goes back to its
+    # own interval as soon as something changes.
+
+    def __init__(self, main, config: dict = None):
+        self.main = main
+        self.stopped = threading.Event()
+
+        if config is None:
+            config = {}
+
+        self.interval = 300
+        if 'interval' in config:
+            self.interval = config['interval']
+
+        self.max_interval = 3600
+        if 'maxInterval' in config:
+            self.max_interval = config['maxInterval']
+
+        self.backoff = 2
+        if 'backoff' in config:
+            self.backoff = config['backoff']
+
+    def run(self, cycles: int = None):
+        self.main.notion.enable_incremental()
+
+        databases = self.main.notion.get_databases()
+        intervals = [self.get_interval(database) for database in databases]
+        schedule = [(time.monotonic(), index) for index in range(len(databases))]
+        heapq.heapify(schedule)
+
+        cycle = 0
+        while schedule and not self.stopped.is_set():
+            if cycles is not None and cycle >= cycles:
+                break
+
+            if self.stopped.wait(max(0.0, schedule[0][0] - time.monotonic())):
+                break
+
+            now = time.monotonic()
+            due = []
+            while schedule and schedule[0][0] <= now:
+                due.append(heapq.heappop(schedule)[1])
+
+            # The first cycle uses the state read at startup; after that only
+            # changes made in Todoist since the previous poll are fetched.
+            if cycle:
+                self.main.todo.state.load()
+
+            results = self.main.sync([databases[index] for index in due])
+            cycle += 1
+
+            for index, result in zip(due, results):
+                intervals[index] = self.next_interval(databases[index], intervals[index], result)
+                heapq.heappush(schedule, (time.monotonic() + intervals[index], index))
+
+                print(f"Next poll of {result['name']} in {intervals[index]}s")
+
+    def stop(self):
+        self.stopped.set()
+
+    def get_interval(self, database: dict):
+        if 'pollInterval' in database:
+            return database['pollInterval']
+
+        return self.interval
+
+    def next_interval(self, database: dict, interval: float, result: dict):
+        base = self.get_interval(database)
+        if result['status'] == 'ok' and result['epics']:
+            return base
+
+        return min(interval * self.backoff, max(base, self.max_interval))
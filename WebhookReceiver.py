@@ -0,0 +1,170 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class WebhookReceiver(ThreadingHTTPServer):
+    # Receives Notion webhook events and syncs only the epics of the pages
+    # they mention. Events for the same page are coalesced: a page is synced
+    # once it has been quiet for coalesceSeconds, or after maxDelay at most.
+    daemon_threads = True
+
+    def __init__(self, main, config: dict = None):
+        if config is None:
+            config = {}
+
+        host = '127.0.0.1'
+        if 'host' in config:
+            host = config['host']
+
+        port = 8787
+        if 'port' in config:
+            port = config['port']
+
+        super().__init__((host, port), WebhookHandler)
+        self.main = main
+
+        self.secret = ''
+        if 'secret' in config:
+            self.secret = config['secret']
+
+        self.coalesce_seconds = 2
+        if 'coalesceSeconds' in config:
+            self.coalesce_seconds = config['coalesceSeconds']
+
+        self.max_delay = 30
+        if 'maxDelay' in config:
+            self.max_delay = config['maxDelay']
+
+        # page id -> (first seen, last seen)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(target=self.drain, daemon=True)
+
+    def run(self):
+        self.worker.start()
+
+        if not self.secret:
+            print("No webhook secret is configured, so event signatures are not checked")
+
+        print(f"Listening for Notion events on {self.server_address[0]}:{self.server_address[1]}")
+
+        try:
+            self.serve_forever()
+        finally:
+            self.stopped.set()
+            self.wake.set()
+            self.worker.join()
+
+    def stop(self):
+        # serve_forever has to be stopped from another thread.
+        threading.Thread(target=self.shutdown).start()
+
+    def verify(self, body: bytes, signature: str):
+        if not self.secret:
+            return True
+
+        expected = 'sha256=' + hmac.new(self.secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+        return hmac.compare_digest(expected, signature or '')
+
+    def add_event(self, event: dict):
+        page_id = self.get_page_id(event)
+        if page_id is None:
+            return False
+
+        now = time.monotonic()
+        with self.lock:
+            first_seen, _ = self.pending.get(page_id, (now, now))
+            self.pending[page_id] = (first_seen, now)
+
+        self.wake.set()
+
+        return True
+
+    def drain(self):
+        while not self.stopped.is_set():
+            self.wake.wait()
+
+            with self.lock:
+                now = time.monotonic()
+                ready = [
+                    page_id for page_id, (first_seen, last_seen) in self.pending.items()
+                    if now - last_seen >= self.coalesce_seconds or now - first_seen >= self.max_delay
+                ]
+
+                for page_id in ready:
+                    del self.pending[page_id]
+
+                next_due = min(
+                    (
+                        min(last_seen + self.coalesce_seconds, first_seen + self.max_delay)
+                        for first_seen, last_seen in self.pending.values()
+                    ),
+                    default=None
+                )
+
+                if next_due is None:
+                    self.wake.clear()
+
+            if ready:
+                print(f"Syncing {len(ready)} changed pages")
+                try:
+                    self.main.sync_pages(ready)
+                except Exception as error:
+                    traceback.print_exception(error)
+
+            if next_due is not None:
+                self.stopped.wait(max(0.0, next_due - time.monotonic()))
+
+    @staticmethod
+    def get_page_id(event: dict):
+        entity = event.get('entity') or {}
+
+        if entity.get('type') == 'page':
+            return entity.get('id')
+
+        # Comment events name the page in their data.
+        data = event.get('data') or {}
+        if data.get('page_id'):
+            return data['page_id']
+
+        return None
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    server: WebhookReceiver
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        try:
+            event = json.loads(body)
+        except ValueError:
+            return self.respond(400)
+
+        # Sent once when the subscription is created, before a secret exists.
+        if 'verification_token' in event:
+            print(f"Notion webhook verification token: {event['verification_token']}")
+            return self.respond(200)
+
+        if not self.server.verify(body, self.headers.get('X-Notion-Signature')):
+            return self.respond(401)
+
+        self.server.add_event(event)
+        self.respond(200)
+
+    def respond(self, status: int):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
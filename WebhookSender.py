@@ -0,0 +1,51 @@
+import argparse
+import hashlib
+import hmac
+import json
+import uuid
+from datetime import datetime, timezone
+
+import requests
+
+
+def get_event(page_id: str, event_type: str):
+    return {
+        'id': str(uuid.uuid4()),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'type': event_type,
+        'entity': {'id': page_id, 'type': 'page'},
+        'data': {}
+    }
+
+
+def send_event(url: str, event: dict, secret: str = ''):
+    body = json.dumps(event).encode('utf-8')
+
+    headers = {'Content-Type': 'application/json'}
+    if secret:
+        headers['X-Notion-Signature'] = 'sha256=' + hmac.new(
+            secret.encode('utf-8'), body, hashlib.sha256
+        ).hexdigest()
+
+    return requests.post(url, data=body, headers=headers, timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Send signed Notion-style page events to a local webhook receiver.'
+    )
+    parser.add_argument('url', help='The receiver, e.g. http://127.0.0.1:8787/')
+    parser.add_argument('pages', nargs='+', help='IDs of the changed pages')
+    parser.add_argument('--secret', default='')
+    parser.add_argument('--type', default='page.properties_updated')
+    parser.add_argument('--burst', type=int, default=1, help='Events sent for every page')
+    args = parser.parse_args()
+
+    for page_id in args.pages:
+        for _ in range(args.burst):
+            response = send_event(args.url, get_event(page_id, args.type), args.secret)
+            print(f"{page_id}: {response.status_code}")
+
+
+if __name__ == '__main__':
+    main()
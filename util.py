@@ -1,6 +1,12 @@
 import json
 import os
 import sys
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def dumpToFile(name, data):
@@ -11,3 +17,79 @@ def dumpToFile(name, data):
 def getJsonFile(name):
     with open(os.path.join(sys.path[0], f'{name}.json')) as configFile:
         return json.load(configFile)
+
+
+def loadJson(data):
+    # orjson is optional; it decodes large query results several times faster.
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+def dumpJson(data):
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+
+    return json.dumps(data)
+
+
+def getStateFile(name, default=None):
+    try:
+        return getJsonFile(name)
+    except FileNotFoundError:
+        return default
+
+
+def saveStateFile(name, data):
+    path = os.path.join(sys.path[0], f'{name}.json')
+
+    # Write to a sibling file and swap it in so an interrupted run never
+    # leaves a truncated state file behind.
+    with open(f'{path}.tmp', 'w') as stateFile:
+        json.dump(data, stateFile)
+
+    os.replace(f'{path}.tmp', path)
+
+
+class Lazy:
+
+    def __init__(self, func):
+        self.func = func
+        self.value = None
+        self.resolved = False
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if not self.resolved:
+                self.value = self.func()
+                self.resolved = True
+                self.func = None
+
+        return self.value
+
+
+class LazyDict(dict):
+    # A dict whose Lazy values are resolved, and stored, on first access.
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+
+        if isinstance(value, Lazy):
+            value = value.get()
+            super().__setitem__(key, value)
+
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+
+        return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]